@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete
 
 
 class ApiConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "api"
+
+    def ready(self):
+        from api.helpers import delete_variants_of
+        from api.metrics import install_query_recorder, store
+        from api.slow_queries import install_slow_query_log
+        from api.models import User, PostFile, PostComment, Message
+
+        for model in (User, PostFile, PostComment, Message):
+            post_delete.connect(delete_variants_of, sender=model)
+
+        # The first wrapper is the outermost, so logging a slow query isn't timed as SQL
+        connection_created.connect(install_slow_query_log)
+        connection_created.connect(install_query_recorder)
+
+        # The files of the workers that exited, or of a previous one with this pid
+        store.prune(own=True)
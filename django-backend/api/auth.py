@@ -1,31 +1,90 @@
-from typing import Literal
+from typing import Any, Literal
 import datetime
+import hashlib
+import hmac
+import time
 
 import jwt
+from django.db import DEFAULT_DB_ALIAS
 from django.db.models import Model
 from django.conf import settings
 from ninja.security import HttpBearer
 
-from api.models import User
+from api.caches import LocalCache
+from api.models import Principal
 
 
 SECRET = settings.SECRET_KEY
+# The file fields are always loaded because django_cleanup remembers them when the model is built
+PRINCIPAL_FIELDS = ["id", "first_name", "last_name", "profile_image", "background_image"]
+
+
+principals = LocalCache(
+    settings.AUTH_PRINCIPAL_CACHE_SIZE, settings.AUTH_PRINCIPAL_CACHE_TTL
+)
 
 
 class AuthBearer(HttpBearer):
-    def authenticate(self, request, token):
-        return authenticate(token)
+    """
+    The bearer is async so async views don't block the event loop on the user lookup,
+    ninja runs it through async_to_sync for the sync views.
+    """
+
+    async def __call__(self, request):
+        result = super().__call__(request)
+        return await result if result else None
+
+    async def authenticate(self, request, token):
+        return await aauthenticate(token)
 
 
-def authenticate(token) -> User | Literal[False]:
+def decode_token(token) -> str | None:
+    """
+    This function returns the user id of a valid JWT token.
+
+    Args:
+        token (str): The JWT token.
+
+    Returns:
+        str | None: The user id or None if the token is expired or invalid.
+    """
+
     try:
-        payload = jwt.decode(token, SECRET, algorithms=["HS256"])
-        return User.objects.filter(id=payload["userId"]).first()
+        return jwt.decode(token, SECRET, algorithms=["HS256"])["userId"]
     except jwt.ExpiredSignatureError:
-        return False
+        return None
     except jwt.InvalidTokenError:
+        return None
+
+
+async def aauthenticate(token) -> Principal | None | Literal[False]:
+    """
+    This function returns the user of a JWT token, the fields in `PRINCIPAL_FIELDS`
+    are cached and the rest are loaded only if a view reads them.
+
+    Args:
+        token (str): The JWT token.
+
+    Returns:
+        Principal | None | Literal[False]: The user, None if the user doesn't exist
+        or False if the token is invalid.
+    """
+
+    if not (user_id := decode_token(token)):
         return False
 
+    if (values := principals.get(user_id)) is None:
+        values = (
+            await Principal.objects.filter(id=user_id)
+            .values_list(*PRINCIPAL_FIELDS)
+            .afirst()
+        )
+        if values is None:
+            return None
+        principals.set(user_id, values)
+
+    return Principal.from_db(DEFAULT_DB_ALIAS, PRINCIPAL_FIELDS, values)
+
 
 def create_token(user: Model) -> str:
     """
@@ -47,3 +106,40 @@ def create_token(user: Model) -> str:
         SECRET,
         algorithm="HS256",
     )
+
+
+def file_signature(name: str, user_id: Any, expires: int) -> str:
+    """
+    Returns the HMAC of a private file name for a user until a unix timestamp.
+    """
+
+    message = f"{name}:{user_id}:{expires}".encode()
+    return hmac.new(SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def sign_private_file(name: str, user_id: Any) -> str:
+    """
+    This function returns a short-lived URL of a private file that only the given user can use,
+    the private router accepts it without looking the file up in the database.
+
+    Args:
+        name (str): The file name (e.g. private/abc.png).
+        user_id (Any): The id of the user that will fetch the file.
+
+    Returns:
+        str: The signed URL of the file.
+    """
+
+    expires = int(time.time()) + settings.PRIVATE_FILE_URL_TTL
+    signature = file_signature(name, user_id, expires)
+    return f"/{name}?expires={expires}&signature={signature}"
+
+
+def verify_private_file(name: str, user_id: Any, expires: int, signature: str) -> bool:
+    """
+    Returns whether the signature of a private file URL is valid for the user and not expired.
+    """
+
+    return expires >= time.time() and hmac.compare_digest(
+        file_signature(name, user_id, expires), signature
+    )
@@ -0,0 +1,227 @@
+"""
+The query-count benchmark of the API endpoints. A social graph is seeded around one user
+and every endpoint is called as that user with the test client, recording the queries,
+the SQL time and the wall time. The query count of an endpoint must not grow with the data,
+otherwise it runs a query per row (N+1).
+"""
+
+from datetime import timedelta
+from typing import Any, Dict
+import time
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api.auth import create_token
+from api.models import (
+    Conversation,
+    Friendship,
+    Message,
+    Notification,
+    Post,
+    PostComment,
+    PostFile,
+    PostLike,
+    TimelineEntry,
+    UnreadCounter,
+    User,
+)
+
+
+# No endpoint may run more queries than this, whatever the data size
+MAX_QUERIES = 15
+
+# The name, the method, the path and the form data of every benchmarked request.
+# The placeholders are filled in from the seeded graph.
+ENDPOINTS = [
+    ("me", "get", "/api/user/me", None),
+    ("profile", "get", "/api/user/{friend}", None),
+    ("search", "get", "/api/user/search/{query}", None),
+    ("friends", "get", "/api/friendship", None),
+    ("friend_profiles", "get", "/api/friendship/profiles?cursor=", None),
+    ("feed", "get", "/api/post/feed?cursor=", None),
+    ("post", "get", "/api/post/{post}", None),
+    ("user_posts", "get", "/api/post/ofUser/{friend}?cursor=", None),
+    ("comments", "get", "/api/post/{post}/comments?cursor=", None),
+    ("like", "post", "/api/post/like/{post}", None),
+    ("comment", "post", "/api/post/comment/{post}", {"content": "Nice post"}),
+    ("create_post", "post", "/api/post", {"content": "Hello"}),
+    ("notifications", "get", "/api/notification/?cursor=", None),
+    ("notification_count", "get", "/api/notification/count", None),
+    ("chats", "get", "/api/message/chats", None),
+    ("unread_messages", "get", "/api/message/unread", None),
+    ("messages", "get", "/api/message/{friend}?cursor=", None),
+    (
+        "send_message",
+        "post",
+        "/api/message",
+        {"recipientId": "{friend}", "content": "Hi"},
+    ),
+]
+
+
+def seed_graph(friends: int, posts: int, prefix: str = "bench") -> Dict[str, Any]:
+    """
+    This function creates a user with friends that are also friends with each other,
+    posts with files, likes and comments, chats and notifications.
+
+    Args:
+        friends (int): The number of friends of the user.
+        posts (int): The number of posts and messages of every user.
+        prefix (str): The prefix of the emails, so graphs can be seeded side by side.
+
+    Returns:
+        Dict[str, Any]: The values the endpoint paths are filled in with.
+    """
+
+    now = timezone.now()
+    user = User.objects.create(
+        email=f"{prefix}@example.com", first_name="Bench", last_name="User", password="!"
+    )
+    others = User.objects.bulk_create(
+        [
+            User(
+                email=f"{prefix}.{i}@example.com",
+                first_name=f"Bench{i}",
+                last_name="Friend",
+                password="!",
+            )
+            for i in range(friends)
+        ]
+    )
+
+    Friendship.objects.bulk_create(
+        [Friendship(requested_by=user, accepted_by=f, accepted_at=now) for f in others]
+        + [
+            Friendship(requested_by=f, accepted_by=g, accepted_at=now)
+            for f, g in zip(others, others[1:])
+        ]
+    )
+
+    authors = [user, *others]
+    all_posts = Post.objects.bulk_create(
+        [
+            Post(
+                author=author,
+                content=f"Post {i}",
+                like_count=friends if author == user else 0,
+                comment_count=friends if author == user else 0,
+            )
+            for author in authors
+            for i in range(posts)
+        ]
+    )
+    user_posts = [p for p in all_posts if p.author_id == user.id]
+    # auto_now_add overrides the given time, the timelines need it distinct
+    for i, post in enumerate(all_posts):
+        post.posted_at = now - timedelta(seconds=i)
+    Post.objects.bulk_update(all_posts, ["posted_at"])
+
+    PostFile.objects.bulk_create(
+        [PostFile(post=p, file="public/bench.png") for p in all_posts]
+    )
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user=user, post=p, posted_at=p.posted_at) for p in all_posts]
+    )
+    PostLike.objects.bulk_create(
+        [PostLike(post=p, liked_by=f) for p in user_posts for f in others]
+    )
+    PostComment.objects.bulk_create(
+        [
+            PostComment(post=p, author=f, content="Nice post")
+            for p in user_posts
+            for f in others
+        ]
+    )
+
+    Message.objects.bulk_create(
+        [
+            Message(sender=f, recipient=user, content=f"Message {i}")
+            for f in others
+            for i in range(posts)
+        ]
+    )
+    Conversation.objects.bulk_create(
+        [
+            Conversation(
+                user=user,
+                friend=f,
+                last_message_at=now,
+                last_message="Message",
+                unread_count=posts,
+            )
+            for f in others
+        ]
+        + [
+            Conversation(user=f, friend=user, last_message_at=now, last_message="Message")
+            for f in others
+        ]
+    )
+
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                recipient=user,
+                type=Notification.Types.FRIEND_POSTED,
+                data={
+                    "postId": str(p.id),
+                    "userId": str(p.author_id),
+                    "firstName": "Bench",
+                    "lastName": "Friend",
+                    "profileImage": None,
+                },
+            )
+            for p in all_posts
+            if p.author_id != user.id
+        ]
+    )
+    UnreadCounter.objects.create(
+        user=user, messages=friends * posts, notifications=friends * posts
+    )
+
+    return {
+        "token": create_token(user),
+        "friend": str(others[0].id) if others else str(user.id),
+        "post": str(user_posts[0].id) if user_posts else "",
+        "query": "Bench",
+    }
+
+
+def run_benchmark(seed: Dict[str, Any], client: Client | None = None) -> Dict[str, Dict]:
+    """
+    This function calls every endpoint in `ENDPOINTS` as the seeded user. Each one is called
+    twice and the second call is measured, so the caches are warm as they mostly are.
+
+    Args:
+        seed (Dict[str, Any]): The values returned by `seed_graph`.
+        client (Client | None): The client to send the requests with.
+
+    Returns:
+        Dict[str, Dict]: The status, the queries, the SQL time and the wall time of every endpoint.
+    """
+
+    client = client or Client()
+    headers = {"HTTP_AUTHORIZATION": f"Bearer {seed['token']}"}
+    report = {}
+
+    for name, method, path, data in ENDPOINTS:
+        path = path.format(**seed)
+        data = data and {k: v.format(**seed) for k, v in data.items()}
+        send = getattr(client, method)
+        send(path, data, **headers)
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = send(path, data, **headers)
+            wall = time.perf_counter() - start
+
+        report[name] = {
+            "status": response.status_code,
+            "queries": len(queries),
+            "sql_ms": round(sum(float(q["time"]) for q in queries) * 1000, 2),
+            "wall_ms": round(wall * 1000, 2),
+        }
+
+    return report
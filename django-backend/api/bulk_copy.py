@@ -0,0 +1,41 @@
+"""
+Bulk loading of tables with COPY, for the commands that write many rows.
+"""
+
+import json
+import tempfile
+
+
+class CopyWriter:
+    """
+    The rows of a table in the COPY text format, spooled to a temporary file
+    so they are sent with a single COPY however many they are.
+    """
+
+    def __init__(self, model, columns):
+        self.table = model._meta.db_table
+        self.columns = columns
+        self.file = tempfile.TemporaryFile("w+")
+        self.rows = 0
+
+    def write(self, *values):
+        self.file.write("\t".join(map(self.encode, values)) + "\n")
+        self.rows += 1
+
+    @staticmethod
+    def encode(value) -> str:
+        if value is None:
+            return r"\N"
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        elif isinstance(value, bool):
+            value = "t" if value else "f"
+        return (
+            str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+        )
+
+    def copy(self, cursor):
+        self.file.seek(0)
+        columns = ", ".join(f'"{c}"' for c in self.columns)
+        cursor.copy_expert(f'COPY "{self.table}" ({columns}) FROM STDIN', self.file)
+        self.file.close()
@@ -0,0 +1,39 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+import threading
+import time
+
+
+class LocalCache:
+    """
+    A bounded LRU cache whose entries expire after a TTL.
+    It's local to the worker, so changes made through another worker are seen after the TTL at most.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, Tuple[float, Any]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            if entry[0] < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -1,38 +1,51 @@
 import json
 
-from channels.generic.websocket import WebsocketConsumer
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.utils import timezone
 
 from api.models import User
-from api.auth import authenticate
+from api.auth import aauthenticate
+from api.helpers import user_group
 
 
-class RealTimeConsumer(WebsocketConsumer):
-    def connect(self):
-        self.accept()
+class RealTimeConsumer(AsyncWebsocketConsumer):
+    """
+    Every socket joins the group of its user, so pushes reach all the open
+    tabs and devices of the user without looking up any channel in the database.
+    """
 
-    def disconnect(self, close_code):
-        user = User.objects.filter(channel=self.channel_name).first()
-        if user:
-            user.channel = ""
-            user.save()
+    user_id = None
 
-    def receive(self, text_data):
+    async def connect(self):
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.user_id:
+            await self.channel_layer.group_discard(
+                user_group(self.user_id), self.channel_name
+            )
+            await self.touch()
+
+    async def receive(self, text_data):
         data = json.loads(text_data)
         if "token" in data:
-            self.handle_auth(data)
+            await self.handle_auth(data)
         else:
-            self.send(json.dumps({"error": "Token is required"}))
-            self.close()
+            await self.send(json.dumps({"error": "Token is required"}))
+            await self.close()
 
-    def handle_auth(self, data):
-        token = data["token"]
-        user = authenticate(token)
+    async def handle_auth(self, data):
+        user = await aauthenticate(data["token"])
         if not user:
-            self.send(json.dumps({"error": "Invalid token"}))
-            self.close()
+            await self.send(json.dumps({"error": "Invalid token"}))
+            await self.close()
             return
-        user.channel = self.channel_name
-        user.save()
+        self.user_id = user.id
+        await self.channel_layer.group_add(user_group(user.id), self.channel_name)
+        await self.touch()
+
+    async def touch(self):
+        await User.objects.filter(id=self.user_id).aupdate(last_active=timezone.now())
 
-    def push(self, event):
-        self.send(json.dumps(event))
+    async def push(self, event):
+        await self.send(json.dumps(event))
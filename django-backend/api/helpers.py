@@ -1,14 +1,41 @@
-from typing import Any, Literal, List, Dict
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Iterable, Literal, List, Dict, Tuple
+import asyncio
+import multiprocessing
+import random
 import uuid
 
 
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import Storage
+from django.db import connection, transaction
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+from django.db.models import Q
 from ninja import Schema, ModelSchema, FilterSchema, NinjaAPI, File, UploadedFile
-from django.db.models import ImageField
+from django.db.models import FileField, ImageField
 from pydantic import UUID4
 
-from api.models import Notification, Message, User
+from api.auth import sign_private_file
+from api.media import process_file
+from api.models import (
+    Friendship,
+    Notification,
+    Message,
+    User,
+    Post,
+    TimelineEntry,
+    UnreadCounter,
+)
+
+NOTIFICATION_PUSH_KEY = "notification-push:{}"
+NOTIFICATION_TRAILING_PUSH_KEY = "notification-trailing-push:{}"
+# How many of the latest actors an aggregated notification shows
+AGGREGATED_ACTORS = 3
 
 # ------------ Snake case to camel case transformation for API usage  BEGIN ------------
 
@@ -58,6 +85,7 @@ def save_file(
 ) -> str | None:
     """
     This function saves the file to the model's image field and returns the file name.
+    The variants of the file are generated in the background after the request.
 
     Args:
         model_image_field (ImageField): The model's image field.
@@ -71,13 +99,187 @@ def save_file(
     if not file or not any(file.content_type.startswith(t) for t in wanted_types):
         return None
 
+    instance = model_image_field.instance
+    variants_field = f"{model_image_field.field.name}_variants"
+    delete_variants(model_image_field.storage, getattr(instance, variants_field))
+    setattr(instance, variants_field, {})
+
     file_extension = file.content_type.split("/")[1]
     file_name = uuid.uuid4().hex + "." + file_extension
-    model_image_field.save(file_name, file)
+    model_image_field.save(file_name, file, save=False)
+    instance.save(update_fields=[model_image_field.field.name, variants_field])
+
+    transaction.on_commit(lambda: process_media(model_image_field))
     return file_name
 
 
-def create_notification(recipient_id: UUID4, type: str, data: Dict[str, Any]):
+_media_executor = None
+
+
+def process_media(file: FieldFile):
+    """
+    This function generates the variants of a saved file in a worker process
+    and stores them in the `<field>_variants` field of its model when they are ready.
+
+    Args:
+        file (FieldFile): The saved file.
+    """
+
+    global _media_executor
+
+    model, pk, name = type(file.instance), file.instance.pk, file.name
+    variants_field = f"{file.field.name}_variants"
+    args = (file.storage.location, name, settings.MEDIA_VARIANT_WIDTHS)
+
+    def store(variants: Dict[str, Dict]):
+        # The file may have been replaced or deleted while it was processed
+        if not model.objects.filter(pk=pk, **{file.field.name: name}).update(
+            **{variants_field: variants}
+        ):
+            delete_variants(file.storage, variants)
+
+    if not settings.MEDIA_PROCESS_WORKERS:
+        return store(process_file(*args))
+
+    def on_done(future: Future):
+        try:
+            store(future.result())
+        finally:
+            connection.close()
+
+    if _media_executor is None:
+        _media_executor = ProcessPoolExecutor(
+            settings.MEDIA_PROCESS_WORKERS, multiprocessing.get_context("spawn")
+        )
+    _media_executor.submit(process_file, *args).add_done_callback(on_done)
+
+
+def delete_variants(storage: Storage, variants: Dict[str, Dict]):
+    """
+    This function deletes the files of the variants of an upload.
+
+    Args:
+        storage (Storage): The storage of the upload.
+        variants (Dict[str, Dict]): The variants by their label.
+    """
+
+    for variant in variants.values():
+        for extension in ("webp", "jpeg"):
+            storage.delete(variant[extension])
+
+
+def sign_variants(variants: Dict[str, Dict], user_id: UUID4) -> Dict[str, Dict]:
+    """
+    Returns the variants of a private file with signed URLs for the user in place of the file names.
+    """
+
+    return {
+        label: {
+            **variant,
+            **{
+                extension: sign_private_file(variant[extension], user_id)
+                for extension in ("webp", "jpeg")
+            },
+        }
+        for label, variant in variants.items()
+    }
+
+
+def delete_variants_of(sender, instance, **kwargs):
+    """
+    Deletes the variants of the files of a deleted model, connected in `ApiConfig.ready`.
+    """
+
+    for field in instance._meta.get_fields():
+        if isinstance(field, FileField) and hasattr(instance, f"{field.name}_variants"):
+            variants = getattr(instance, f"{field.name}_variants")
+            transaction.on_commit(
+                lambda field=field, variants=variants: delete_variants(
+                    field.storage, variants
+                )
+            )
+
+
+def user_group(user_id: UUID4) -> str:
+    """
+    Returns the channel layer group of a user, every open socket of the user joins it.
+    """
+
+    return f"user_{user_id}"
+
+
+async def apush_event(user_ids: Iterable[UUID4], event: str, data: Any):
+    """
+    This function pushes an event to the open sockets of the given users in one batch.
+
+    Args:
+        user_ids (Iterable[UUID4]): The ids of the users to push the event to.
+        event (str): The event name.
+        data (Any): The event data.
+    """
+
+    channel_layer = get_channel_layer()
+    message = {"type": "push", "event": event, "data": data}
+    await asyncio.gather(
+        *(channel_layer.group_send(user_group(id), message) for id in user_ids)
+    )
+
+
+@transaction.atomic
+def insert_notifications(
+    recipient_ids: List[UUID4], type: str, data: Dict[str, Any]
+) -> Dict[str, Dict[str, int]]:
+    """
+    This function inserts the same notification for many recipients and counts it
+    in their unread notifications, all of them or none are written.
+
+    Args:
+        recipient_ids (List[UUID4]): The recipient IDs.
+        type (str): The notification type.
+        data (dict[str, Any]): The camel case notification data.
+
+    Returns:
+        Dict[str, Dict[str, int]]: The unread counters of the recipients.
+    """
+
+    Notification.objects.bulk_create(
+        [Notification(recipient_id=id, type=type, data=data) for id in recipient_ids]
+    )
+    return add_unread(recipient_ids, notifications=1)
+
+
+async def acreate_notifications(
+    recipient_ids: Iterable[UUID4], type: str, data: Dict[str, Any]
+):
+    """
+    This function creates the same notification for many recipients
+    with one insert and one batch of pushes.
+
+    Args:
+        recipient_ids (Iterable[UUID4]): The recipient IDs.
+        type (str): The notification type.
+        data (dict[str, Any]): The notification data.
+    """
+
+    recipient_ids = list(recipient_ids)
+    if not recipient_ids:
+        return
+
+    data = {snake_case_to_camel_case(k): v for k, v in data.items()}
+
+    counters = await sync_to_async(insert_notifications)(recipient_ids, type, data)
+
+    await asyncio.gather(
+        *(
+            apush_event(
+                [id], "NEW_NOTIFICATION", {"unreadCount": counter["notifications"]}
+            )
+            for id, counter in counters.items()
+        )
+    )
+
+
+async def acreate_notification(recipient_id: UUID4, type: str, data: Dict[str, Any]):
     """
     This function creates a notification for the recipient.
 
@@ -87,19 +289,182 @@ def create_notification(recipient_id: UUID4, type: str, data: Dict[str, Any]):
         data (dict[str, Any]): The notification data.
     """
 
-    data = {snake_case_to_camel_case(k): v for k, v in data.items()}
+    await acreate_notifications([recipient_id], type, data)
+
+
+def aggregate_notification(
+    recipient_id: UUID4, type: str, data: Dict[str, Any]
+) -> Tuple[Notification | None, Dict[str, Dict[str, int]]]:
+    """
+    This function adds the actor of the data (`userId` and their name and image) to the
+    unread notification of the same type and post of the recipient within
+    `NOTIFICATION_AGGREGATION_WINDOW`, or creates and counts one if there isn't any.
+
+    Args:
+        recipient_id (UUID4): The recipient id.
+        type (str): The notification type.
+        data (Dict[str, Any]): The camel case notification data, with a `postId`.
+
+    Returns:
+        Tuple[Notification | None, Dict[str, Dict[str, int]]]: The notification, or None
+        if the actor is one of its latest actors already, and the unread counters of the recipient.
+    """
 
-    Notification.objects.create(recipient_id=recipient_id, type=type, data=data)
+    actor = {k: data[k] for k in ("userId", "firstName", "lastName", "profileImage")}
+    with transaction.atomic():
+        notification = (
+            Notification.objects.select_for_update()
+            .filter(
+                recipient_id=recipient_id,
+                type=type,
+                read=False,
+                created_at__gte=timezone.now()
+                - timedelta(seconds=settings.NOTIFICATION_AGGREGATION_WINDOW),
+                data__postId=data["postId"],
+            )
+            .order_by("-created_at")
+            .first()
+        )
+
+        if not notification:
+            data = {
+                **data,
+                "actors": [actor],
+                "actorIds": [actor["userId"]],
+                "actorCount": 1,
+            }
+            return (
+                Notification.objects.create(
+                    recipient_id=recipient_id, type=type, data=data
+                ),
+                add_unread([recipient_id], notifications=1),
+            )
+
+        # Liking again after unliking isn't counted, all the actors of the group are kept
+        actors = notification.data.get("actors", [])
+        actor_ids = notification.data.get("actorIds") or [a["userId"] for a in actors]
+        if actor["userId"] in actor_ids:
+            return None, {}
+
+        actor_ids = [*actor_ids, actor["userId"]]
+        notification.data = {
+            **data,
+            "actors": [actor, *actors][:AGGREGATED_ACTORS],
+            "actorIds": actor_ids,
+            "actorCount": len(actor_ids),
+        }
+        notification.created_at = timezone.now()
+        notification.save(update_fields=["data", "created_at"])
+        return notification, add_unread([recipient_id])
+
+
+# The pending trailing pushes, so they aren't garbage collected
+_trailing_pushes = set()
+
+
+async def acreate_aggregated_notification(
+    recipient_id: UUID4, type: str, data: Dict[str, Any]
+):
+    """
+    This function creates a notification about a post for the recipient or adds
+    the actor to a recent one, see `aggregate_notification`. The pushes of
+    a notification are sent at most once per `NOTIFICATION_PUSH_DEBOUNCE`,
+    the updates within an interval are pushed at its end.
+
+    Args:
+        recipient_id (UUID4): The recipient id.
+        type (str): The notification type.
+        data (dict[str, Any]): The notification data, with a `postId`.
+    """
 
-    if (channel := User.objects.filter(id=recipient_id).first().channel):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.send)(
-            channel,
-            {"type": "push", "event": "NEW_NOTIFICATION", "data": ""},
+    data = {snake_case_to_camel_case(k): v for k, v in data.items()}
+    notification, counters = await sync_to_async(aggregate_notification)(
+        recipient_id, type, data
+    )
+    if not notification:
+        return
+
+    debounce = settings.NOTIFICATION_PUSH_DEBOUNCE
+    if await cache.aadd(NOTIFICATION_PUSH_KEY.format(notification.id), True, debounce):
+        await apush_event(
+            [recipient_id],
+            "NEW_NOTIFICATION",
+            {"unreadCount": counters[str(recipient_id)]["notifications"]},
         )
+    elif await cache.aadd(
+        NOTIFICATION_TRAILING_PUSH_KEY.format(notification.id), True, debounce
+    ):
+        # The updates within the interval are pushed once at its end
+        task = asyncio.create_task(apush_unread_notifications(recipient_id, debounce))
+        _trailing_pushes.add(task)
+        task.add_done_callback(_trailing_pushes.discard)
+
 
+async def apush_unread_notifications(recipient_id: UUID4, delay: float = 0):
+    """
+    This function pushes the current unread notifications of the recipient after a delay.
+
+    Args:
+        recipient_id (UUID4): The recipient id.
+        delay (float): The seconds to wait before the push.
+    """
+
+    await asyncio.sleep(delay)
+    await apush_event(
+        [recipient_id],
+        "NEW_NOTIFICATION",
+        {
+            "unreadCount": await UnreadCounter.objects.filter(user_id=recipient_id)
+            .values_list("notifications", flat=True)
+            .afirst()
+            or 0
+        },
+    )
+
+
+def create_notifications(
+    recipient_ids: Iterable[UUID4], type: str, data: Dict[str, Any]
+):
+    """
+    Sync version of `acreate_notifications` for the sync views.
+    """
+
+    async_to_sync(acreate_notifications)(recipient_ids, type, data)
 
+
+def create_notification(recipient_id: UUID4, type: str, data: Dict[str, Any]):
+    """
+    Sync version of `acreate_notification` for the sync views.
+    """
+
+    async_to_sync(acreate_notification)(recipient_id, type, data)
+
+
+@transaction.atomic
 def create_message(
+    sender_id: UUID4, recipient_id: UUID4, content: str | None
+) -> Tuple[Message, Dict[str, Dict[str, int]]]:
+    """
+    This function creates a message and counts it in the conversations and the unread
+    messages of the recipient, all of them or none are written.
+
+    Args:
+        sender_id (UUID4): The sender id.
+        recipient_id (UUID4): The recipient id.
+        content (str | None): The message content.
+
+    Returns:
+        Tuple[Message, Dict[str, Dict[str, int]]]: The message and the unread counters of the recipient.
+    """
+
+    m = Message.objects.create(
+        sender_id=sender_id, recipient_id=recipient_id, content=content
+    )
+    update_conversations(m)
+    return m, add_unread([recipient_id], messages=1)
+
+
+async def acreate_message(
     sender_id: UUID4,
     recipient_id: UUID4,
     content: str | None,
@@ -115,25 +480,285 @@ def create_message(
         file (File[UploadedFile] | None): The message file.
     """
 
-    m = Message.objects.create(
-        sender_id=sender_id, recipient_id=recipient_id, content=content
+    m, counters = await sync_to_async(create_message)(sender_id, recipient_id, content)
+    await sync_to_async(save_file)(m.file, file, ["image", "video"])
+
+    await apush_event(
+        [recipient_id],
+        "NEW_MESSAGE",
+        {
+            "id": str(m.id),
+            "senderId": str(m.sender_id),
+            "recipientId": str(m.recipient_id),
+            "content": m.content,
+            "file": sign_private_file(m.file.name, recipient_id) if m.file else None,
+            "sentAt": str(m.sent_at),
+            "unreadCount": counters[str(recipient_id)]["messages"],
+        },
     )
-    save_file(m.file, file, ["image", "video"])
 
-    if (channel := User.objects.filter(id=recipient_id).first().channel):
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.send)(
-            channel,
+
+def add_unread(
+    user_ids: Iterable[UUID4], messages: int = 0, notifications: int = 0
+) -> Dict[str, Dict[str, int]]:
+    """
+    This function adds to the unread counters of the users (negative values subtract)
+    and returns their new values, the missing counters are created.
+
+    Args:
+        user_ids (Iterable[UUID4]): The ids of the users.
+        messages (int): The change of the unread messages.
+        notifications (int): The change of the unread notifications.
+
+    Returns:
+        Dict[str, Dict[str, int]]: The unread messages and notifications by user id.
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+                INSERT INTO "api_unreadcounter" AS "counter"
+                    ("user_id", "messages", "notifications")
+                SELECT "id", GREATEST(%(messages)s, 0), GREATEST(%(notifications)s, 0)
+                FROM unnest(%(user_ids)s::uuid[]) AS "id"
+                ON CONFLICT ("user_id") DO UPDATE SET
+                    "messages" = GREATEST("counter"."messages" + %(messages)s, 0),
+                    "notifications" = GREATEST("counter"."notifications" + %(notifications)s, 0)
+                RETURNING "user_id", "messages", "notifications"
+            """,
             {
-                "type": "push",
-                "event": "NEW_MESSAGE",
-                "data": {
-                    "id": str(m.id),
-                    "senderId": str(m.sender_id),
-                    "recipientId": str(m.recipient_id),
-                    "content": m.content,
-                    "file": m.file.url if m.file else None,
-                    "sentAt": str(m.sent_at),
-                },
+                "user_ids": [str(id) for id in user_ids],
+                "messages": messages,
+                "notifications": notifications,
             },
         )
+        return {
+            str(id): {"messages": messages, "notifications": notifications}
+            for id, messages, notifications in cursor.fetchall()
+        }
+
+
+def update_conversations(message: Message):
+    """
+    This function updates the conversations of both the sender and the recipient
+    with the given message, creating them if it's their first message.
+
+    Args:
+        message (Message): The new message.
+    """
+
+    preview = message.content or "📎 Attachment"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+                INSERT INTO "api_conversation"
+                    ("id", "user_id", "friend_id", "last_message_at", "last_message", "unread_count")
+                VALUES
+                    (%(sender_conversation)s, %(sender)s, %(recipient)s, %(sent_at)s, %(sender_preview)s, 0),
+                    (%(recipient_conversation)s, %(recipient)s, %(sender)s, %(sent_at)s, %(preview)s, 1)
+                ON CONFLICT ("user_id", "friend_id") DO UPDATE SET
+                    "last_message_at" = GREATEST(
+                        "api_conversation"."last_message_at", EXCLUDED."last_message_at"
+                    ),
+                    "last_message" = CASE
+                        WHEN EXCLUDED."last_message_at" >= "api_conversation"."last_message_at"
+                            THEN EXCLUDED."last_message"
+                        ELSE
+                            "api_conversation"."last_message"
+                    END,
+                    "unread_count" = "api_conversation"."unread_count" + EXCLUDED."unread_count"
+            """,
+            {
+                "sender_conversation": uuid.uuid4(),
+                "recipient_conversation": uuid.uuid4(),
+                "sender": message.sender_id,
+                "recipient": message.recipient_id,
+                "sent_at": message.sent_at,
+                "sender_preview": f"You: {preview}",
+                "preview": preview,
+            },
+        )
+
+
+def fan_out_post(post: Post, recipient_ids: Iterable[UUID4]):
+    """
+    This function pushes the post to the timelines of the recipients.
+
+    Args:
+        post (Post): The post to push.
+        recipient_ids (Iterable[UUID4]): The ids of the users whose timeline receives the post.
+    """
+
+    recipient_ids = list(recipient_ids)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=id, post_id=post.id, posted_at=post.posted_at)
+            for id in recipient_ids
+        ],
+        ignore_conflicts=True,
+    )
+    trim_timelines(
+        [
+            id
+            for id in recipient_ids
+            if random.randrange(settings.FEED_TIMELINE_TRIM_EVERY) == 0
+        ]
+    )
+
+
+def trim_timelines(user_ids: List[UUID4]):
+    """
+    This function removes the posts of the users' timelines that are older than
+    the latest `FEED_TIMELINE_SIZE` ones. Each timeline is walked on its index
+    up to the first post that is removed.
+
+    Args:
+        user_ids (List[UUID4]): The ids of the users whose timeline is trimmed.
+    """
+
+    if not user_ids:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+                DELETE FROM "api_timelineentry" AS "entry"
+                USING
+                    unnest(%(users)s::uuid[]) AS "timeline" ("user_id"),
+                    LATERAL (
+                        SELECT "posted_at" FROM "api_timelineentry"
+                        WHERE "user_id" = "timeline"."user_id"
+                        ORDER BY "posted_at" DESC
+                        OFFSET %(size)s LIMIT 1
+                    ) AS "cutoff"
+                WHERE
+                    "entry"."user_id" = "timeline"."user_id"
+                    AND "entry"."posted_at" <= "cutoff"."posted_at"
+            """,
+            {
+                "users": [str(id) for id in user_ids],
+                "size": settings.FEED_TIMELINE_SIZE,
+            },
+        )
+
+
+def backfill_timelines(first_user_id: UUID4, second_user_id: UUID4):
+    """
+    This function pushes the latest posts of two new friends to each other's timeline.
+
+    Args:
+        first_user_id (UUID4): The first user id.
+        second_user_id (UUID4): The second user id.
+    """
+
+    entries = []
+    for user_id, author_id in (
+        (first_user_id, second_user_id),
+        (second_user_id, first_user_id),
+    ):
+        posts = Post.objects.filter(author_id=author_id, fanned_out=True).order_by(
+            "-posted_at"
+        )[: settings.FEED_BACKFILL_SIZE]
+        entries += [
+            TimelineEntry(user_id=user_id, post_id=post.id, posted_at=post.posted_at)
+            for post in posts
+        ]
+
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def prune_timelines(first_user_id: UUID4, second_user_id: UUID4):
+    """
+    This function removes the posts of two former friends from each other's timeline.
+
+    Args:
+        first_user_id (UUID4): The first user id.
+        second_user_id (UUID4): The second user id.
+    """
+
+    TimelineEntry.objects.filter(
+        Q(user_id=first_user_id, post__author_id=second_user_id)
+        | Q(user_id=second_user_id, post__author_id=first_user_id)
+    ).delete()
+
+
+def update_mutual_friends(
+    first_user_id: UUID4, second_user_id: UUID4, change: Literal[1, -1]
+):
+    """
+    This function updates the mutual friend counts when two users become friends (1)
+    or stop being friends (-1), each of them is a mutual friend of the other one
+    and every friend of the other one. It must run in the transaction that accepted
+    or removed the friendship, it locks both users so the friendship changes of a user
+    are counted one after the other, each seeing the friends the previous one committed.
+
+    Args:
+        first_user_id (UUID4): The first user id.
+        second_user_id (UUID4): The second user id.
+        change (Literal[1, -1]): Whether the friendship was accepted or removed.
+    """
+
+    user_ids = sorted([first_user_id, second_user_id])
+    list(User.objects.select_for_update().filter(id__in=user_ids).order_by("id"))
+
+    # The friends are read from the friendships, the cache may be behind other workers
+    friends = {id: set() for id in user_ids}
+    for requested_by, accepted_by in Friendship.objects.filter(
+        Q(requested_by__in=user_ids) | Q(accepted_by__in=user_ids),
+        accepted_at__isnull=False,
+    ).values_list("requested_by_id", "accepted_by_id"):
+        if requested_by in friends:
+            friends[requested_by].add(accepted_by)
+        if accepted_by in friends:
+            friends[accepted_by].add(requested_by)
+
+    pairs = []
+    for user_id, friend_id in (
+        (first_user_id, second_user_id),
+        (second_user_id, first_user_id),
+    ):
+        for other_id in friends[friend_id] - {user_id}:
+            pairs += [(str(user_id), str(other_id)), (str(other_id), str(user_id))]
+
+    if not pairs:
+        return
+
+    # The rows are locked in the same order by concurrent updates, so they can't deadlock
+    users, others = zip(*sorted(pairs))
+    with connection.cursor() as cursor:
+        if change > 0:
+            cursor.execute(
+                """
+                    INSERT INTO "api_mutualfriendcount" AS "mutual"
+                        ("id", "user_id", "other_id", "count")
+                    SELECT "id", "user_id", "other_id", 1
+                    FROM unnest(%(ids)s::uuid[], %(users)s::uuid[], %(others)s::uuid[])
+                        AS "pair" ("id", "user_id", "other_id")
+                    ON CONFLICT ("user_id", "other_id") DO UPDATE SET
+                        "count" = "mutual"."count" + 1
+                """,
+                {
+                    "ids": [str(uuid.uuid4()) for _ in users],
+                    "users": list(users),
+                    "others": list(others),
+                },
+            )
+        else:
+            cursor.execute(
+                """
+                    UPDATE "api_mutualfriendcount" AS "mutual"
+                    SET "count" = GREATEST("mutual"."count" - 1, 0)
+                    FROM unnest(%(users)s::uuid[], %(others)s::uuid[])
+                        AS "pair" ("user_id", "other_id")
+                    WHERE "mutual"."user_id" = "pair"."user_id"
+                        AND "mutual"."other_id" = "pair"."other_id"
+                """,
+                {"users": list(users), "others": list(others)},
+            )
+            cursor.execute(
+                """
+                    DELETE FROM "api_mutualfriendcount"
+                    WHERE "count" = 0 AND "user_id" = ANY(%(users)s::uuid[])
+                """,
+                {"users": list(set(users))},
+            )
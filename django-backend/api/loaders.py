@@ -0,0 +1,138 @@
+"""
+Request-scoped batch loaders, they resolve a field of many serialized objects with one query
+instead of one per object. The objects are collected before the response is serialized,
+and every id that wasn't collected is loaded on its own when it's resolved.
+"""
+
+from abc import ABC, abstractmethod
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Set, Type
+import uuid
+
+from django.db.models import Q
+from django.http import HttpRequest
+
+from api.models import Friendship, MutualFriendCount, User
+
+
+class BatchLoader(ABC):
+    """
+    A value of the authenticated user for other users, the ids added before
+    a value is read are loaded together and the missing ones get the default.
+    """
+
+    default: Any = None
+
+    def __init__(self, user: User):
+        self.user = user
+        self.pending: Set[uuid.UUID] = set()
+        self.values: Dict[uuid.UUID, Any] = {}
+
+    def add(self, ids: Iterable[uuid.UUID]):
+        self.pending.update(id for id in ids if id not in self.values)
+
+    def get(self, id: uuid.UUID) -> Any:
+        if id not in self.values:
+            self.add([id])
+            self.load()
+        return self.values[id]
+
+    def load(self):
+        """
+        Loads the values of all the pending ids with one query.
+        """
+
+        ids, self.pending = self.pending, set()
+        self.values.update((id, self.default) for id in ids)
+        self.values.update(self.fetch(ids))
+
+    @abstractmethod
+    def fetch(self, ids: Set[uuid.UUID]) -> Dict[uuid.UUID, Any]:
+        """
+        Returns the values of the ids that have one.
+        """
+
+
+class FriendshipStatusLoader(BatchLoader):
+    """
+    The friendship status of the authenticated user with other users:
+    stranger, friend, requested (sent by the authenticated user) or received.
+    """
+
+    default = "stranger"
+
+    def fetch(self, ids: Set[uuid.UUID]) -> Dict[uuid.UUID, str]:
+        friendships = Friendship.objects.filter(
+            Q(requested_by=self.user, accepted_by__in=ids)
+            | Q(requested_by__in=ids, accepted_by=self.user)
+        ).values_list("requested_by_id", "accepted_by_id", "accepted_at")
+
+        statuses = {}
+        for requested_by, accepted_by, accepted_at in friendships:
+            if accepted_at:
+                friend = accepted_by if requested_by == self.user.id else requested_by
+                statuses[friend] = "friend"
+            elif requested_by == self.user.id:
+                statuses[accepted_by] = "requested"
+            else:
+                statuses[requested_by] = "received"
+        return statuses
+
+
+class MutualFriendCountLoader(BatchLoader):
+    """
+    The mutual friends of the authenticated user with other users.
+    """
+
+    default = 0
+
+    def fetch(self, ids: Set[uuid.UUID]) -> Dict[uuid.UUID, int]:
+        return dict(
+            MutualFriendCount.objects.filter(user=self.user, other__in=ids).values_list(
+                "other_id", "count"
+            )
+        )
+
+
+def loader(request: HttpRequest, cls: Type[BatchLoader]) -> BatchLoader:
+    if not hasattr(request, "loaders"):
+        request.loaders = {}
+    if cls not in request.loaders:
+        request.loaders[cls] = cls(request.auth)
+    return request.loaders[cls]
+
+
+def friendship_statuses(request: HttpRequest) -> FriendshipStatusLoader:
+    return loader(request, FriendshipStatusLoader)
+
+
+def mutual_friend_counts(request: HttpRequest) -> MutualFriendCountLoader:
+    return loader(request, MutualFriendCountLoader)
+
+
+def load_users(view: Callable) -> Callable:
+    """
+    This decorator collects the users a view returns, so their values are loaded
+    together by every loader. It goes under the router decorator and over `paginate`,
+    the page is fetched here instead of while it's serialized.
+
+    Args:
+        view (Callable): A view that returns users or a page of users.
+
+    Returns:
+        Callable: The decorated view.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        result = view(request, *args, **kwargs)
+        if isinstance(result, dict) and "items" in result:
+            users = result["items"] = list(result["items"])
+        else:
+            users = result = list(result)
+
+        for cls in (FriendshipStatusLoader, MutualFriendCountLoader):
+            loader(request, cls).add(user.id for user in users)
+        return result
+
+    return wrapper
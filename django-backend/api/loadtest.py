@@ -0,0 +1,166 @@
+"""
+A small in-process HTTP load driver that calls the ASGI application directly,
+so the numbers reflect a single uvicorn worker without any network in between.
+"""
+
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Tuple
+import asyncio
+import math
+import time
+
+
+async def asgi_request(
+    app: Callable,
+    method: str,
+    path: str,
+    token: str | None = None,
+    body: bytes = b"",
+    content_type: str | None = None,
+) -> int:
+    """
+    This function sends one HTTP request to an ASGI application and returns the status code,
+    see `asgi_response` for the arguments.
+    """
+
+    status, _ = await asgi_response(app, method, path, token, body, content_type)
+    return status
+
+
+async def asgi_response(
+    app: Callable,
+    method: str,
+    path: str,
+    token: str | None = None,
+    body: bytes = b"",
+    content_type: str | None = None,
+) -> Tuple[int, bytes]:
+    """
+    This function sends one HTTP request to an ASGI application.
+
+    Args:
+        app (Callable): The ASGI application.
+        method (str): The HTTP method.
+        path (str): The path, it may include a query string.
+        token (str | None): The JWT token to authenticate with.
+        body (bytes): The request body.
+        content_type (str | None): The content type of the body.
+
+    Returns:
+        Tuple[int, bytes]: The response status code and body.
+    """
+
+    path, _, query = path.partition("?")
+    headers = [(b"host", b"localhost")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    if body:
+        headers.append((b"content-length", str(len(body)).encode()))
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": headers,
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+
+    status = 0
+    chunks = []
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Returns the p-th percentile (0-100) of the values with the nearest-rank method.
+    """
+
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def run_load(
+    requests: Iterable[Tuple[str, Callable[[], Awaitable[int]]]], concurrency: int
+) -> Dict[str, Any]:
+    """
+    This function runs the requests with the given concurrency and reports
+    the throughput and the latency percentiles per request name.
+
+    Args:
+        requests (Iterable[Tuple[str, Callable[[], Awaitable[int]]]]): Pairs of a name
+            and a function that sends the request and returns its status code.
+        concurrency (int): How many requests are in flight at the same time.
+
+    Returns:
+        Dict[str, Any]: The total throughput and the stats of every request name.
+    """
+
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+
+    async def worker():
+        while not queue.empty():
+            name, send = queue.get_nowait()
+            start = time.perf_counter()
+            status = await send()
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            if status >= 400:
+                errors[name] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": sum(len(l) for l in latencies.values()),
+        "seconds": round(elapsed, 3),
+        "throughput": round(sum(len(l) for l in latencies.values()) / elapsed, 1),
+        "endpoints": {
+            name: {
+                "requests": len(l),
+                "errors": errors[name],
+                "throughput": round(len(l) / elapsed, 1),
+                "p50": round(percentile(l, 50), 2),
+                "p95": round(percentile(l, 95), 2),
+                "p99": round(percentile(l, 99), 2),
+            }
+            for name, l in sorted(latencies.items())
+        },
+    }
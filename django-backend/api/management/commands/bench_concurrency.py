@@ -0,0 +1,61 @@
+import asyncio
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+
+from api.auth import create_token
+from api.loadtest import asgi_request, run_load
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the throughput of one worker at increasing concurrency. "
+        "Run it before and after a change (e.g. sync vs async views) to compare them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("email", help="The user the requests are sent as")
+        parser.add_argument(
+            "--paths",
+            nargs="+",
+            default=[
+                "/api/post/feed?cursor=",
+                "/api/notification/?cursor=",
+                "/api/notification/count",
+                "/api/message/unread",
+                "/api/message/chats",
+            ],
+        )
+        parser.add_argument(
+            "--concurrency", nargs="+", type=int, default=[1, 8, 32, 128]
+        )
+        parser.add_argument("--requests", type=int, default=400)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["email"]).first()
+        if not user:
+            raise CommandError("User not found")
+
+        token = create_token(user)
+        app = get_asgi_application()
+        paths = options["paths"]
+
+        def requests():
+            for i in range(options["requests"]):
+                path = paths[i % len(paths)]
+                yield path, lambda path=path: asgi_request(app, "GET", path, token)
+
+        baseline = None
+        for concurrency in options["concurrency"]:
+            report = asyncio.run(run_load(requests(), concurrency))
+            baseline = baseline or report["throughput"]
+            self.stdout.write(
+                f"concurrency {concurrency:>4}: {report['throughput']:>8} req/s "
+                f"({report['throughput'] / baseline:.1f}x)"
+            )
+            for path, stats in report["endpoints"].items():
+                self.stdout.write(
+                    f"    {path:<40} p50 {stats['p50']:>8} ms  p95 {stats['p95']:>8} ms"
+                    f"  errors {stats['errors']}"
+                )
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.benchmark import MAX_QUERIES, run_benchmark, seed_graph
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a social graph, calls every endpoint and reports the queries, the SQL time "
+        "and the wall time of each one. Everything is rolled back at the end. "
+        "Save the report with --output and pass it with --compare on the next commit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--friends", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=20)
+        parser.add_argument("--output", help="The file the JSON report is written to")
+        parser.add_argument("--compare", help="A previous JSON report to compare with")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            seed = seed_graph(options["friends"], options["posts"])
+            report = run_benchmark(seed)
+            transaction.set_rollback(True)
+
+        previous = {}
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                previous = json.load(f)["endpoints"]
+
+        failed = False
+        for name, stats in report.items():
+            line = (
+                f"{name:<20} {stats['status']}  queries {stats['queries']:>3}  "
+                f"sql {stats['sql_ms']:>8} ms  wall {stats['wall_ms']:>8} ms"
+            )
+            if before := previous.get(name):
+                line += (
+                    f"  (queries {stats['queries'] - before['queries']:+}, "
+                    f"wall {stats['wall_ms'] - before['wall_ms']:+.2f} ms)"
+                )
+            if stats["queries"] > MAX_QUERIES or (
+                before and stats["queries"] > before["queries"]
+            ):
+                line = self.style.ERROR(line)
+                failed = True
+            self.stdout.write(line)
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(
+                    {
+                        "friends": options["friends"],
+                        "posts": options["posts"],
+                        "endpoints": report,
+                    },
+                    f,
+                    indent=4,
+                )
+
+        if failed:
+            raise CommandError(
+                f"Some endpoints run more queries than before or more than {MAX_QUERIES}"
+            )
@@ -0,0 +1,114 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+FIRST_NAMES = [
+    "John", "Jane", "Maria", "George", "Helen", "Nick", "Anna", "Peter",
+    "Sophia", "Michael", "Eleni", "Kostas", "Dimitra", "Alex", "Chris", "Laura",
+]
+LAST_NAMES = [
+    "Doe", "Smith", "Papadopoulos", "Johnson", "Brown", "Petrakis", "Miller",
+    "Georgiou", "Wilson", "Nikolaou", "Taylor", "Anderson", "Ioannou", "Clark",
+]
+
+# The same shape as the queries the search endpoint sends
+SEARCH_SQL = """
+    SELECT id FROM bench_user
+    WHERE UPPER(first_name) LIKE UPPER(%(contains)s)
+        OR UPPER(last_name) LIKE UPPER(%(contains)s)
+        OR UPPER(email) LIKE UPPER(%(prefix)s)
+    ORDER BY GREATEST(
+        WORD_SIMILARITY(%(query)s, first_name), WORD_SIMILARITY(%(query)s, last_name)
+    ) DESC
+    LIMIT 100
+"""
+
+INDEXES_SQL = [
+    "CREATE INDEX ON bench_user USING gin (UPPER(first_name) gin_trgm_ops)",
+    "CREATE INDEX ON bench_user USING gin (UPPER(last_name) gin_trgm_ops)",
+    "CREATE INDEX ON bench_user (UPPER(email) text_pattern_ops)",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the user search with and without the trigram indexes "
+        "on a synthetic users table, the real one isn't touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1_000_000)
+        parser.add_argument(
+            "--queries", nargs="+", default=["Doe", "papad", "geor", "trakis", "xyz"]
+        )
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            self.create_table(cursor, options["users"])
+
+            self.stdout.write("Without indexes (sequential scan):")
+            before = self.measure(cursor, options["queries"], options["runs"])
+
+            start = time.perf_counter()
+            for sql in INDEXES_SQL:
+                cursor.execute(sql)
+            cursor.execute("ANALYZE bench_user")
+            self.stdout.write(
+                f"Indexes built in {time.perf_counter() - start:.1f} s\n"
+                "With the trigram indexes:"
+            )
+            after = self.measure(cursor, options["queries"], options["runs"])
+
+            cursor.execute("DROP TABLE bench_user")
+
+        for query in options["queries"]:
+            self.stdout.write(
+                f"    {query:<12} {before[query] / after[query]:>6.1f}x faster"
+            )
+
+    def create_table(self, cursor, users):
+        start = time.perf_counter()
+        cursor.execute("DROP TABLE IF EXISTS bench_user")
+        cursor.execute(
+            """
+            CREATE UNLOGGED TABLE bench_user AS
+            SELECT
+                gen_random_uuid() AS id,
+                (%(first)s::text[])[1 + i %% cardinality(%(first)s::text[])]
+                    || substr(md5(i::text), 1, 3) AS first_name,
+                (%(last)s::text[])[1 + (i / 7) %% cardinality(%(last)s::text[])]
+                    || substr(md5(i::text), 4, 3) AS last_name,
+                'user' || i || '@example.com' AS email
+            FROM generate_series(1, %(users)s) AS i
+            """,
+            {"first": FIRST_NAMES, "last": LAST_NAMES, "users": users},
+        )
+        cursor.execute("ANALYZE bench_user")
+        self.stdout.write(
+            f"Created {users} users in {time.perf_counter() - start:.1f} s"
+        )
+
+    def measure(self, cursor, queries, runs):
+        """
+        Returns the median milliseconds of every query and prints them.
+        """
+
+        medians = {}
+        for query in queries:
+            params = {"query": query, "contains": f"%{query}%", "prefix": f"{query}%"}
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                cursor.execute(SEARCH_SQL, params)
+                cursor.fetchall()
+                timings.append((time.perf_counter() - start) * 1000)
+
+            medians[query] = statistics.median(timings)
+            self.stdout.write(f"    {query:<12} {medians[query]:>10.2f} ms")
+
+        return medians
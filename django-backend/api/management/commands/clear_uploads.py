@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import Upload
+from api.uploads import delete_upload
+
+
+class Command(BaseCommand):
+    help = "Deletes the uploads that weren't used within UPLOAD_EXPIRY_HOURS."
+
+    def handle(self, *args, **options):
+        expired = Upload.objects.filter(
+            created_at__lt=timezone.now()
+            - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+        )
+
+        count = 0
+        for upload in expired.iterator():
+            delete_upload(upload)
+            count += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} uploads"))
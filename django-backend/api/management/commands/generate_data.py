@@ -0,0 +1,335 @@
+from datetime import timedelta
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.bulk_copy import CopyWriter
+from api.management.commands.bench_search import FIRST_NAMES, LAST_NAMES
+from api.models import (
+    Conversation,
+    Friendship,
+    Message,
+    Notification,
+    Post,
+    PostComment,
+    PostFile,
+    PostLike,
+    TimelineEntry,
+    UnreadCounter,
+    User,
+)
+from api.partitions import PARTITIONED_TABLES, create_partition, month_start
+
+
+# The exponent of the power laws, the few popular users have most friends, posts and likes
+ALPHA = 2
+PENDING_RATIO = 0.05
+FILE_RATIO = 0.2
+CHAT_RATIO = 0.3
+# Notifications older than this are read
+READ_AFTER = timedelta(days=3)
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk-generates users with a power-law friendship graph, posts with files, likes "
+        "and comments, chats and notifications with COPY. Every user's password is the same."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10_000)
+        parser.add_argument(
+            "--friends", type=int, default=5, help="Friendships each new user makes"
+        )
+        parser.add_argument("--posts", type=float, default=5, help="Mean posts per user")
+        parser.add_argument("--likes", type=float, default=4, help="Mean likes per post")
+        parser.add_argument(
+            "--comments", type=float, default=2, help="Mean comments per post"
+        )
+        parser.add_argument(
+            "--messages", type=float, default=20, help="Mean messages per chat"
+        )
+        parser.add_argument("--days", type=int, default=90, help="The history length")
+        parser.add_argument(
+            "--prefix", default="user", help="The emails are <prefix><n>@example.com"
+        )
+        parser.add_argument("--password", default="password")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options["days"])
+        self.writers = []
+        started = time.perf_counter()
+
+        users = self.generate_users(options)
+        friends = self.generate_friendships(users, options["friends"])
+        self.generate_posts(users, friends, options)
+        self.generate_chats(users, friends, options["messages"])
+        counters = self.writer(UnreadCounter, "user_id", "messages", "notifications")
+        for i, id in enumerate(users):
+            counters.write(id, self.unread_messages[i], self.unread_notifications[i])
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in PARTITIONED_TABLES:
+                month = month_start(self.start)
+                while month <= self.now.date():
+                    create_partition(cursor, table, month)
+                    month = month_start(month, 1)
+
+            for writer in self.writers:
+                writer.copy(cursor)
+                self.stdout.write(f"{writer.table:<20} {writer.rows:>10} rows")
+
+        call_command("rebuild_mutual_friends", stdout=self.stdout)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Generated in {time.perf_counter() - started:.1f} s")
+        )
+
+    def writer(self, model, *columns) -> CopyWriter:
+        writer = CopyWriter(model, columns)
+        self.writers.append(writer)
+        return writer
+
+    def power_law(self, mean: float) -> int:
+        return int(self.rng.paretovariate(ALPHA) * mean * (ALPHA - 1) / ALPHA)
+
+    def moment(self, after=None):
+        after = after or self.start
+        return after + (self.now - after) * self.rng.random()
+
+    def generate_users(self, options):
+        self.names = []
+        users = self.writer(
+            User,
+            "id",
+            "joined_at",
+            "last_active",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "profile_image_variants",
+            "background_image_variants",
+        )
+
+        password = make_password(options["password"])
+        ids = []
+        for i in range(options["users"]):
+            ids.append(uuid.uuid4())
+            name = (self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES))
+            self.names.append(name)
+            email = f"{options['prefix']}{i}@example.com"
+            users.write(ids[i], self.start, self.now, email, password, *name, {}, {})
+
+        self.unread_messages = [0] * len(ids)
+        self.unread_notifications = [0] * len(ids)
+        return ids
+
+    def generate_friendships(self, users, per_user):
+        """
+        Preferential attachment: every new user befriends `per_user` users picked
+        in proportion to the friends they already have.
+        """
+
+        friendships = self.writer(
+            Friendship, "id", "requested_by_id", "accepted_by_id", "accepted_at"
+        )
+        friends = [[] for _ in users]
+        # Every user appears once per friendship, so picking from it follows the degree
+        ends = []
+        for i in range(len(users)):
+            targets = set(range(i)) if i <= per_user else set()
+            while len(targets) < min(per_user, i):
+                targets.add(self.rng.choice(ends))
+
+            for j in targets:
+                accepted = self.rng.random() >= PENDING_RATIO
+                friendships.write(
+                    uuid.uuid4(), users[i], users[j], self.moment() if accepted else None
+                )
+                if accepted:
+                    friends[i].append(j)
+                    friends[j].append(i)
+                ends += [i, j]
+
+        return friends
+
+    def generate_posts(self, users, friends, options):
+        posts = self.writer(
+            Post,
+            "id",
+            "author_id",
+            "posted_at",
+            "content",
+            "fanned_out",
+            "like_count",
+            "comment_count",
+        )
+        files = self.writer(PostFile, "id", "post_id", "file", "file_variants")
+        likes = self.writer(PostLike, "id", "post_id", "liked_by_id")
+        comments = self.writer(
+            PostComment,
+            "id",
+            "post_id",
+            "author_id",
+            "commented_at",
+            "content",
+            "file_variants",
+        )
+        timelines = self.writer(TimelineEntry, "id", "user_id", "post_id", "posted_at")
+        self.notifications = self.writer(
+            Notification, "id", "recipient_id", "created_at", "type", "data", "read"
+        )
+
+        for author in range(len(users)):
+            for n in range(self.power_law(options["posts"])):
+                id = uuid.uuid4()
+                posted_at = self.moment()
+                audience = friends[author]
+                likers = self.rng.sample(
+                    audience, min(len(audience), self.power_law(options["likes"]))
+                )
+                commenters = [
+                    self.rng.choice(audience)
+                    for _ in range(self.power_law(options["comments"]) if audience else 0)
+                ]
+                fanned_out = len(audience) <= settings.FEED_FANOUT_LIMIT
+
+                posts.write(
+                    id,
+                    users[author],
+                    posted_at,
+                    f"Post {n}",
+                    fanned_out,
+                    len(likers),
+                    len(commenters),
+                )
+                if self.rng.random() < FILE_RATIO:
+                    files.write(uuid.uuid4(), id, "public/generated.png", {})
+                for user in [author, *audience] if fanned_out else [author]:
+                    timelines.write(uuid.uuid4(), users[user], id, posted_at)
+
+                for user in likers:
+                    likes.write(uuid.uuid4(), id, users[user])
+                for user in commenters:
+                    comments.write(
+                        uuid.uuid4(), id, users[user], self.moment(posted_at), "Nice post", {}
+                    )
+
+                for user in audience:
+                    self.notify(
+                        users, user, posted_at, Notification.Types.FRIEND_POSTED, author, id
+                    )
+                if likers:
+                    self.notify(
+                        users, author, posted_at, Notification.Types.POST_LIKED, likers, id
+                    )
+                if commenters:
+                    self.notify(
+                        users,
+                        author,
+                        posted_at,
+                        Notification.Types.POST_COMMENTED,
+                        commenters,
+                        id,
+                    )
+
+    def notify(self, users, recipient, created_at, type, actors, post_id):
+        """
+        Likes and comments are notified aggregated per post, as the views do.
+        """
+
+        def actor(i):
+            first_name, last_name = self.names[i]
+            return {
+                "userId": str(users[i]),
+                "firstName": first_name,
+                "lastName": last_name,
+                "profileImage": None,
+            }
+
+        if isinstance(actors, int):
+            data = {"postId": str(post_id), **actor(actors)}
+        else:
+            latest = list(dict.fromkeys(reversed(actors)))
+            data = {
+                "postId": str(post_id),
+                **actor(latest[0]),
+                "actors": [actor(i) for i in latest[:3]],
+                "actorIds": [str(users[i]) for i in dict.fromkeys(actors)],
+                "actorCount": len(set(actors)),
+            }
+            if type == Notification.Types.POST_COMMENTED:
+                data["content"] = "Nice post"
+
+        read = created_at < self.now - READ_AFTER
+        self.notifications.write(uuid.uuid4(), users[recipient], created_at, type, data, read)
+        self.unread_notifications[recipient] += not read
+
+    def generate_chats(self, users, friends, mean):
+        messages = self.writer(
+            Message,
+            "id",
+            "sender_id",
+            "recipient_id",
+            "sent_at",
+            "content",
+            "file_variants",
+            "read",
+        )
+        conversations = self.writer(
+            Conversation,
+            "id",
+            "user_id",
+            "friend_id",
+            "last_message_at",
+            "last_message",
+            "unread_count",
+        )
+
+        for a in range(len(users)):
+            for b in friends[a]:
+                if b < a or self.rng.random() >= CHAT_RATIO:
+                    continue
+
+                count = max(1, self.power_law(mean))
+                sent_at = sorted(self.moment() for _ in range(count))
+                senders = [self.rng.choice((a, b)) for _ in range(count)]
+                # The last messages from the same sender may be unread
+                unread = self.rng.randint(0, min(3, count))
+                senders[count - unread :] = [senders[-1]] * unread
+
+                for i in range(count):
+                    sender = senders[i]
+                    recipient = b if sender == a else a
+                    messages.write(
+                        uuid.uuid4(),
+                        users[sender],
+                        users[recipient],
+                        sent_at[i],
+                        f"Message {i}",
+                        {},
+                        i < count - unread,
+                    )
+
+                last_recipient = b if senders[-1] == a else a
+                self.unread_messages[last_recipient] += unread
+                for user, friend in ((a, b), (b, a)):
+                    conversations.write(
+                        uuid.uuid4(),
+                        users[user],
+                        users[friend],
+                        sent_at[-1],
+                        f"Message {count - 1}",
+                        unread if user == last_recipient else 0,
+                    )
@@ -0,0 +1,131 @@
+from urllib.parse import quote
+import asyncio
+import json
+import random
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+from api.auth import create_token
+from api.loadtest import asgi_request, asgi_response, run_load
+from api.models import Friendship, TimelineEntry, User
+
+
+# The relative frequency of every action, as the frontend sends them
+MIX = {
+    "feed": 40,
+    "chats": 10,
+    "chat": 15,
+    "like": 15,
+    "comment": 5,
+    "search": 10,
+    "notifications": 5,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Replays a mix of API calls (feed scroll, chat open, like, comment, search) as "
+        "users created by `manage.py generate_data`, and reports the throughput and the "
+        "latency percentiles of every action. Likes and comments are written for real."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prefix", default="user", help="As given to generate_data")
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="The file the JSON report is written to")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        users = list(
+            User.objects.filter(email__startswith=options["prefix"]).order_by("email")[
+                : options["users"]
+            ]
+        )
+        if not users:
+            raise CommandError("No users found, run `manage.py generate_data` first")
+
+        sessions = []
+        for user in users:
+            friendships = Friendship.objects.filter(
+                Q(requested_by=user) | Q(accepted_by=user), accepted_at__isnull=False
+            ).values_list("requested_by", "accepted_by")
+            sessions.append(
+                {
+                    "token": create_token(user),
+                    "friends": [a if a != user.id else b for a, b in friendships],
+                    "posts": list(
+                        TimelineEntry.objects.filter(user=user)
+                        .order_by("-posted_at")
+                        .values_list("post_id", flat=True)[:50]
+                    ),
+                    "name": user.first_name[:4],
+                    "cursor": "",
+                }
+            )
+
+        app = get_asgi_application()
+        comment = encode_multipart(BOUNDARY, {"content": "Load test comment"})
+
+        async def scroll(session):
+            path = f"/api/post/feed?cursor={quote(session['cursor'])}"
+            status, body = await asgi_response(app, "GET", path, session["token"])
+            if status == 200:
+                session["cursor"] = json.loads(body).get("next") or ""
+            return status
+
+        def action(name, session):
+            token = session["token"]
+            friend = rng.choice(session["friends"] or [None])
+            post = rng.choice(session["posts"] or [None])
+            if name == "feed":
+                return lambda: scroll(session)
+            if name == "chats":
+                return lambda: asgi_request(app, "GET", "/api/message/chats", token)
+            if name == "chat" and friend:
+                path = f"/api/message/{friend}?cursor="
+                return lambda: asgi_request(app, "GET", path, token)
+            if name == "like" and post:
+                path = f"/api/post/like/{post}"
+                return lambda: asgi_request(app, "POST", path, token)
+            if name == "comment" and post:
+                path = f"/api/post/comment/{post}"
+                return lambda: asgi_request(
+                    app, "POST", path, token, comment, MULTIPART_CONTENT
+                )
+            if name == "search":
+                path = f"/api/user/search/{session['name']}"
+                return lambda: asgi_request(app, "GET", path, token)
+            if name == "notifications":
+                path = "/api/notification/?cursor="
+                return lambda: asgi_request(app, "GET", path, token)
+            return None
+
+        def requests():
+            sent = 0
+            while sent < options["requests"]:
+                name = rng.choices(list(MIX), weights=list(MIX.values()))[0]
+                if send := action(name, rng.choice(sessions)):
+                    sent += 1
+                    yield name, send
+
+        report = asyncio.run(run_load(requests(), options["concurrency"]))
+        self.stdout.write(
+            f"{report['requests']} requests in {report['seconds']} s, "
+            f"{report['throughput']} req/s at concurrency {report['concurrency']}"
+        )
+        for name, stats in report["endpoints"].items():
+            self.stdout.write(
+                f"    {name:<15} {stats['requests']:>6} req  {stats['throughput']:>8} req/s"
+                f"  p50 {stats['p50']:>8} ms  p95 {stats['p95']:>8} ms"
+                f"  p99 {stats['p99']:>8} ms  errors {stats['errors']}"
+            )
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=4)
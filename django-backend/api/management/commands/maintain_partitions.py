@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.partitions import (
+    PARTITIONED_TABLES,
+    create_partition,
+    detach_partition,
+    month_start,
+    partition_months,
+    partition_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the partitions of the next months for the notifications and the messages, "
+        "and detaches the notification partitions older than NOTIFICATION_RETENTION_MONTHS. "
+        "Run it at least once a month."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--months", type=int, default=3, help="How many months ahead to create"
+        )
+
+    def handle(self, *args, **options):
+        this_month = month_start(timezone.now())
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            for table in PARTITIONED_TABLES:
+                for months in range(options["months"] + 1):
+                    month = month_start(this_month, months)
+                    if create_partition(cursor, table, month):
+                        self.stdout.write(f"Created {partition_name(table, month)}")
+
+        if not settings.NOTIFICATION_RETENTION_MONTHS:
+            return
+
+        oldest_kept = month_start(this_month, -settings.NOTIFICATION_RETENTION_MONTHS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            expired = [
+                month
+                for month in partition_months(cursor, "api_notification")
+                if month < oldest_kept
+            ]
+            for month in expired:
+                detach_partition(
+                    cursor,
+                    "api_notification",
+                    month,
+                    settings.NOTIFICATION_RETENTION_ARCHIVE,
+                )
+                self.stdout.write(
+                    f"Detached {partition_name('api_notification', month)}"
+                )
+
+        # Unread notifications may have been detached
+        if expired:
+            call_command("reconcile_unread_counters", stdout=self.stdout)
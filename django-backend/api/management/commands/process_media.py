@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.media import process_file
+from api.models import User, PostFile, PostComment, Message
+
+
+FILE_FIELDS = [
+    (User, "profile_image"),
+    (User, "background_image"),
+    (PostFile, "file"),
+    (PostComment, "file"),
+    (Message, "file"),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the variants of the uploads that don't have any, "
+        "e.g. the ones saved before the variants existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="Regenerate the variants of every upload"
+        )
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(settings.MEDIA_PROCESS_WORKERS or None) as pool:
+            for model, field in FILE_FIELDS:
+                variants_field = f"{field}_variants"
+                rows = model.objects.exclude(**{f"{field}__isnull": True}).exclude(
+                    **{field: ""}
+                )
+                if not options["all"]:
+                    rows = rows.filter(**{variants_field: {}})
+
+                rows = list(rows.values_list("pk", field))
+                storage = model._meta.get_field(field).storage
+                results = pool.map(
+                    process_file,
+                    [storage.location] * len(rows),
+                    [name for _, name in rows],
+                    [settings.MEDIA_VARIANT_WIDTHS] * len(rows),
+                )
+
+                for (pk, name), variants in zip(rows, results):
+                    model.objects.filter(pk=pk, **{field: name}).update(
+                        **{variants_field: variants}
+                    )
+
+                self.stdout.write(
+                    f"Processed {len(rows)} {model._meta.verbose_name} {field} files"
+                )
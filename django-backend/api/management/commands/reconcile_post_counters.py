@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Post, PostLike, PostComment
+
+
+def count_of(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(post=OuterRef("id"))
+            .values("post")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recounts the likes and comments of the posts whose stored counters drifted."
+
+    def handle(self, *args, **options):
+        drifted = (
+            Post.objects.annotate(
+                actual_like_count=count_of(PostLike),
+                actual_comment_count=count_of(PostComment),
+            )
+            .filter(
+                ~Q(like_count=F("actual_like_count"))
+                | ~Q(comment_count=F("actual_comment_count"))
+            )
+            .values("id")
+        )
+
+        fixed = Post.objects.filter(id__in=drifted).update(
+            like_count=count_of(PostLike), comment_count=count_of(PostComment)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} posts"))
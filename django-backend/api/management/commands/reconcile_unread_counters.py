@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Message, Notification, UnreadCounter
+
+
+def unread_of(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipient=OuterRef("user"), read=False)
+            .values("recipient")
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    help = "Recounts the unread messages and notifications of the users whose counters drifted."
+
+    def handle(self, *args, **options):
+        drifted = (
+            UnreadCounter.objects.annotate(
+                actual_messages=unread_of(Message),
+                actual_notifications=unread_of(Notification),
+            )
+            .filter(
+                ~Q(messages=F("actual_messages"))
+                | ~Q(notifications=F("actual_notifications"))
+            )
+            .values("user")
+        )
+
+        fixed = UnreadCounter.objects.filter(user__in=drifted).update(
+            messages=unread_of(Message), notifications=unread_of(Notification)
+        )
+        self.stdout.write(self.style.SUCCESS(f"Reconciled {fixed} unread counters"))
@@ -0,0 +1,78 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+
+SORT_KEYS = {
+    "total": lambda group: group["total_ms"],
+    "max": lambda group: group["slowest"]["duration_ms"],
+    "mean": lambda group: group["total_ms"] / group["count"],
+    "count": lambda group: group["count"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Ranks the statements of the slow-query log by fingerprint, the statements that "
+        "differ only in their literals and parameters. Shows the operations that ran them "
+        "and, with --plans, the EXPLAIN ANALYZE plan of the slowest one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sort", choices=SORT_KEYS, default="total")
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument("--hours", type=float, help="Only the last hours of the log")
+        parser.add_argument("--plans", action="store_true")
+
+    def handle(self, *args, **options):
+        if not os.path.exists(settings.SLOW_QUERY_LOG):
+            raise CommandError(f"There is no slow-query log at {settings.SLOW_QUERY_LOG}")
+
+        since = options["hours"] and timezone.now() - timedelta(hours=options["hours"])
+        groups = {}
+        with open(settings.SLOW_QUERY_LOG) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if since and datetime.fromisoformat(entry["time"]) < since:
+                    continue
+
+                group = groups.setdefault(
+                    entry["fingerprint"],
+                    {"count": 0, "total_ms": 0, "operations": Counter(), "slowest": entry},
+                )
+                group["count"] += 1
+                group["total_ms"] += entry["duration_ms"]
+                group["operations"][entry["operation"] or "-"] += 1
+                if entry["duration_ms"] > group["slowest"]["duration_ms"]:
+                    group["slowest"] = entry
+
+        ranked = sorted(groups.items(), key=lambda item: SORT_KEYS[options["sort"]](item[1]))
+        for fingerprint, group in reversed(ranked[-options["limit"] :]):
+            slowest = group["slowest"]
+            operations = ", ".join(
+                f"{name} ({count})" for name, count in group["operations"].most_common(3)
+            )
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{fingerprint}  {group['count']:>5} times  "
+                    f"total {group['total_ms']:>10.2f} ms  "
+                    f"mean {group['total_ms'] / group['count']:>8.2f} ms  "
+                    f"max {slowest['duration_ms']:>8.2f} ms"
+                )
+            )
+            self.stdout.write(f"    operations: {operations}")
+            self.stdout.write(f"    {slowest['normalized']}")
+            if slowest["params"] is not None:
+                self.stdout.write(f"    slowest params: {slowest['params']}")
+            if options["plans"] and slowest["plan"]:
+                for row in slowest["plan"].splitlines():
+                    self.stdout.write(f"        {row}")
+            self.stdout.write("")
@@ -0,0 +1,140 @@
+"""
+The image and video processing of the uploads. It runs in worker processes
+that don't set up Django, so it only deals with paths on the disk.
+"""
+
+from typing import Dict
+import os
+import shutil
+import subprocess
+import tempfile
+
+from PIL import Image, ImageOps
+
+
+FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+
+
+def variant_name(name: str, label: str, extension: str) -> str:
+    """
+    Returns the name of a variant next to the upload (public/abc.png -> public/abc.small.webp).
+    """
+
+    return f"{name.rsplit('.', 1)[0]}.{label}.{extension}"
+
+
+def process_image(
+    root: str,
+    name: str,
+    widths: Dict[str, int],
+    source: str | None = None,
+    label_prefix: str = "",
+) -> Dict[str, Dict]:
+    """
+    This function writes a WebP and a JPEG of the image for every width that is
+    smaller than the image itself, the aspect ratio is kept.
+
+    Args:
+        root (str): The directory the file names are relative to.
+        name (str): The file name of the upload, the variants are named after it.
+        widths (Dict[str, int]): The widths of the variants by their label.
+        source (str | None): The file name of the image if it isn't the upload itself.
+        label_prefix (str): A prefix for the labels of the variants.
+
+    Returns:
+        Dict[str, Dict]: The width, height and file names of every variant by its label.
+    """
+
+    variants = {}
+    with Image.open(os.path.join(root, source or name)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        for label, width in sorted(widths.items(), key=lambda item: item[1]):
+            if width >= image.width:
+                continue
+
+            resized = image.resize(
+                (width, max(1, round(image.height * width / image.width))),
+                Image.Resampling.LANCZOS,
+            )
+            variant = {"width": resized.width, "height": resized.height}
+            for extension, format in FORMATS.items():
+                variant[extension] = variant_name(
+                    name, label_prefix + label, extension
+                )
+                resized.save(
+                    os.path.join(root, variant[extension]), format, quality=80
+                )
+
+            variants[label_prefix + label] = variant
+
+    return variants
+
+
+def process_video(root: str, name: str, widths: Dict[str, int]) -> Dict[str, Dict]:
+    """
+    This function extracts a poster frame of the video with ffmpeg and processes it
+    like an image. Nothing is generated if ffmpeg isn't installed.
+
+    Args:
+        root (str): The directory the file names are relative to.
+        name (str): The file name of the video.
+        widths (Dict[str, int]): The widths of the poster variants by their label.
+
+    Returns:
+        Dict[str, Dict]: The poster and its variants by their label.
+    """
+
+    if not shutil.which("ffmpeg"):
+        return {}
+
+    with tempfile.NamedTemporaryFile(suffix=".png") as frame:
+        result = subprocess.run(
+            ["ffmpeg", "-y", "-loglevel", "error", "-ss", "1", "-i"]
+            + [os.path.join(root, name), "-frames:v", "1", frame.name],
+            capture_output=True,
+        )
+        if result.returncode or not os.path.getsize(frame.name):
+            return {}
+
+        with Image.open(frame.name) as image:
+            image = image.convert("RGB")
+            poster = {"width": image.width, "height": image.height}
+            for extension, format in FORMATS.items():
+                poster[extension] = variant_name(name, "poster", extension)
+                image.save(
+                    os.path.join(root, poster[extension]), format, quality=80
+                )
+
+    return {
+        "poster": poster,
+        **process_image(
+            root, name, widths, source=poster["jpeg"], label_prefix="poster-"
+        ),
+    }
+
+
+def process_file(root: str, name: str, widths: Dict[str, int]) -> Dict[str, Dict]:
+    """
+    This function generates the variants of an uploaded image or video.
+    Unknown and corrupted files get no variants, clients then use the original.
+
+    Args:
+        root (str): The directory the file names are relative to.
+        name (str): The file name of the upload.
+        widths (Dict[str, int]): The widths of the variants by their label.
+
+    Returns:
+        Dict[str, Dict]: The variants by their label.
+    """
+
+    try:
+        with Image.open(os.path.join(root, name)) as image:
+            image.verify()
+        return process_image(root, name, widths)
+    except Image.UnidentifiedImageError:
+        return process_video(root, name, widths)
+    except (Image.DecompressionBombError, OSError, SyntaxError, ValueError):
+        return {}
@@ -0,0 +1,331 @@
+"""
+Per-request instrumentation. The queries are timed by an execute wrapper installed on every
+database connection, the serialization by wrapping the ninja operations, and the `collect_metrics`
+middleware adds them up into a `Server-Timing` header and the histograms served at /metrics.
+
+Every worker keeps its own histograms and writes them to a file of its own in `METRICS_DIR`
+every `METRICS_FLUSH_INTERVAL` seconds, /metrics adds up the files of all the workers.
+The files of the workers that exited are removed, so their counts drop out of the totals,
+which Prometheus treats as a counter reset.
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator
+import json
+import os
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from ninja import NinjaAPI
+from ninja.operation import Operation
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# The name, the help text and the buckets of every histogram
+HISTOGRAMS = {
+    "duration": (
+        "openbook_request_duration_seconds",
+        "The total time of the requests",
+        LATENCY_BUCKETS,
+    ),
+    "db_time": (
+        "openbook_request_db_seconds",
+        "The time the requests spent in SQL queries",
+        LATENCY_BUCKETS,
+    ),
+    "serialization_time": (
+        "openbook_request_serialization_seconds",
+        "The time the requests spent validating and rendering the responses",
+        LATENCY_BUCKETS,
+    ),
+    "queries": (
+        "openbook_request_queries",
+        "The SQL queries of the requests",
+        QUERY_BUCKETS,
+    ),
+}
+REQUESTS_TOTAL = "openbook_requests_total"
+
+
+class RequestMetrics:
+    """
+    The measurements of the current request, the operation is None if no ninja operation ran.
+    """
+
+    def __init__(self):
+        self.operation = None
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialization_time = 0.0
+
+
+current_metrics: ContextVar[RequestMetrics | None] = ContextVar(
+    "current_metrics", default=None
+)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    An execute wrapper that adds every query to the metrics of the current request.
+    """
+
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    A `connection_created` receiver, the wrappers stay on the connection until it's closed.
+    """
+
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def instrument_operations(api: NinjaAPI):
+    """
+    This function wraps every operation of the api, so the metrics of a request know
+    its operation and how long its response took to serialize. The queries that run
+    while serializing (e.g. of a lazy queryset) count as database time only.
+
+    Args:
+        api (NinjaAPI): The api, after all its routers are added.
+    """
+
+    for op in operations(api):
+        op.run = labelled(op.run, operation_id(api, op))
+        op._result_to_response = timed(op._result_to_response)
+
+
+def operations(api: NinjaAPI) -> Iterator[Operation]:
+    for _, router in api._routers:
+        for view in router.path_operations.values():
+            yield from view.operations
+
+
+def operation_id(api: NinjaAPI, op: Operation) -> str:
+    """
+    Returns the id of the operation as in the OpenAPI schema, e.g. api_views_post_get_feed.
+    """
+
+    return op.operation_id or api.get_openapi_operation_id(op)
+
+
+def labelled(run: Callable, operation_id: str) -> Callable:
+    if iscoroutinefunction(run):
+
+        @wraps(run)
+        async def async_run(request, *args, **kwargs):
+            if metrics := current_metrics.get():
+                metrics.operation = operation_id
+            return await run(request, *args, **kwargs)
+
+        return async_run
+
+    @wraps(run)
+    def sync_run(request, *args, **kwargs):
+        if metrics := current_metrics.get():
+            metrics.operation = operation_id
+        return run(request, *args, **kwargs)
+
+    return sync_run
+
+
+def timed(result_to_response: Callable) -> Callable:
+    @wraps(result_to_response)
+    def wrapper(*args, **kwargs):
+        if (metrics := current_metrics.get()) is None:
+            return result_to_response(*args, **kwargs)
+
+        start, db_time = time.perf_counter(), metrics.db_time
+        try:
+            return result_to_response(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.serialization_time += elapsed - (metrics.db_time - db_time)
+
+    return wrapper
+
+
+def server_timing(metrics: RequestMetrics, duration: float) -> str:
+    """
+    Returns the `Server-Timing` header of the request, the durations are in milliseconds.
+    """
+
+    return (
+        f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries", '
+        f"serialization;dur={metrics.serialization_time * 1000:.2f}, "
+        f"total;dur={duration * 1000:.2f}"
+    )
+
+
+class MetricsStore:
+    """
+    The histograms of this worker, they are cumulative like Prometheus expects them,
+    so the files of the workers are added up bucket by bucket.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series: Dict[str, Dict[str, Any]] = {}
+        self.flushed_at = time.monotonic()
+
+    def observe(self, metrics: RequestMetrics, duration: float, status: int) -> bool:
+        """
+        Adds the request to the histograms, returns whether they are due to be flushed.
+        """
+
+        labels = f'operation="{metrics.operation or "unmatched"}"'
+        values = {
+            "duration": duration,
+            "db_time": metrics.db_time,
+            "serialization_time": metrics.serialization_time,
+            "queries": metrics.queries,
+        }
+
+        with self.lock:
+            for key, value in values.items():
+                name, _, buckets = HISTOGRAMS[key]
+                series = self.series.setdefault(name, {}).setdefault(
+                    labels, {"buckets": [0] * len(buckets), "sum": 0, "count": 0}
+                )
+                for i, bound in enumerate(buckets):
+                    series["buckets"][i] += value <= bound
+                series["sum"] += value
+                series["count"] += 1
+
+            totals = self.series.setdefault(REQUESTS_TOTAL, {})
+            key = f'{labels},status="{status}"'
+            totals[key] = totals.get(key, 0) + 1
+
+            # Only one request flushes the histograms of an interval
+            if time.monotonic() - self.flushed_at < settings.METRICS_FLUSH_INTERVAL:
+                return False
+            self.flushed_at = time.monotonic()
+            return True
+
+    def flush(self):
+        """
+        Writes the histograms to the file of the worker. They are copied under the lock
+        and written without it, so the requests observed meanwhile don't wait for the disk.
+        The file is replaced at once, so it's never read half written.
+        """
+
+        with self.lock:
+            snapshot = json.dumps(self.series)
+            self.flushed_at = time.monotonic()
+
+        os.makedirs(settings.METRICS_DIR, exist_ok=True)
+        path = os.path.join(settings.METRICS_DIR, f"{os.getpid()}.json")
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        with open(temporary, "w") as f:
+            f.write(snapshot)
+        os.replace(temporary, path)
+
+    def prune(self, own: bool = False):
+        """
+        Removes the files of the workers that exited, and with `own` the file of this
+        worker's pid, which a previous worker with the same pid may have left.
+        """
+
+        if not os.path.isdir(settings.METRICS_DIR):
+            return
+
+        for file in os.listdir(settings.METRICS_DIR):
+            pid = file.split(".")[0]
+            if not pid.isdigit():
+                continue
+            if (int(pid) == os.getpid() and not own) or (
+                int(pid) != os.getpid() and alive(int(pid))
+            ):
+                continue
+            try:
+                os.remove(os.path.join(settings.METRICS_DIR, file))
+            except FileNotFoundError:
+                pass  # Another worker removed it
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Returns the histograms of all the live workers added up.
+        """
+
+        self.flush()
+        self.prune()
+
+        merged = {}
+        for file in os.listdir(settings.METRICS_DIR):
+            if not file.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(settings.METRICS_DIR, file)) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            for name, series in worker.items():
+                for labels, value in series.items():
+                    target = merged.setdefault(name, {})
+                    if name == REQUESTS_TOTAL:
+                        target[labels] = target.get(labels, 0) + value
+                    elif labels not in target:
+                        target[labels] = value
+                    else:
+                        total = target[labels]
+                        total["buckets"] = [
+                            a + b for a, b in zip(total["buckets"], value["buckets"])
+                        ]
+                        total["sum"] += value["sum"]
+                        total["count"] += value["count"]
+
+        return merged
+
+    def render(self) -> str:
+        """
+        Returns the histograms of all the workers in the Prometheus text format.
+        """
+
+        merged = self.collect()
+        lines = []
+        for name, help, buckets in HISTOGRAMS.values():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} histogram"]
+            for labels, series in sorted(merged.get(name, {}).items()):
+                for bound, count in zip(buckets, series["buckets"]):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+                lines.append(f"{name}_sum{{{labels}}} {series['sum']}")
+                lines.append(f"{name}_count{{{labels}}} {series['count']}")
+
+        lines += [
+            f"# HELP {REQUESTS_TOTAL} The requests by operation and status",
+            f"# TYPE {REQUESTS_TOTAL} counter",
+        ]
+        for labels, count in sorted(merged.get(REQUESTS_TOTAL, {}).items()):
+            lines.append(f"{REQUESTS_TOTAL}{{{labels}}} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # It's a process of another user
+    return True
+
+
+store = MetricsStore()
@@ -1,10 +1,13 @@
 from collections.abc import Callable
 from typing import Any
+import time
 
 from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.http import HttpRequest
 from django.utils.decorators import sync_and_async_middleware
 
+from api.metrics import RequestMetrics, current_metrics, server_timing, store
+
 
 @sync_and_async_middleware
 def process_put_patch(get_response: Callable) -> Callable:
@@ -43,3 +46,38 @@ def process_put_patch(get_response: Callable) -> Callable:
         return get_response(request)
 
     return async_middleware if iscoroutinefunction(get_response) else sync_middleware
+
+
+@sync_and_async_middleware
+def collect_metrics(get_response: Callable) -> Callable:
+    """
+    This is a middleware that measures the requests, it adds the `Server-Timing` header
+    and feeds the histograms of /metrics. It should be the first one so it measures the rest.
+    """
+
+    def finish(metrics, token, start, response) -> bool:
+        duration = time.perf_counter() - start
+        current_metrics.reset(token)
+        response["Server-Timing"] = server_timing(metrics, duration)
+        return store.observe(metrics, duration, response.status_code)
+
+    async def async_middleware(request: HttpRequest) -> Any:
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        response = await get_response(request)
+        if finish(metrics, token, start, response):
+            # The file is written off the event loop
+            await sync_to_async(store.flush, thread_sensitive=False)()
+        return response
+
+    def sync_middleware(request: HttpRequest) -> Any:
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        start = time.perf_counter()
+        response = get_response(request)
+        if finish(metrics, token, start, response):
+            store.flush()
+        return response
+
+    return async_middleware if iscoroutinefunction(get_response) else sync_middleware
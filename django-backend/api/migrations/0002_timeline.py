@@ -0,0 +1,55 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:29
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='fanned_out',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('posted_at', models.DateTimeField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='api.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to='api.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-posted_at'], name='timeline_user_posted_at')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_timeline_entry'),
+        ),
+        # Build the timelines of the already existing posts
+        migrations.RunSQL(
+            """
+                INSERT INTO "api_timelineentry" ("id", "user_id", "post_id", "posted_at")
+                SELECT gen_random_uuid(), "author_id", "id", "posted_at"
+                FROM "api_post"
+                UNION ALL
+                SELECT gen_random_uuid(), "accepted_by_id", "api_post"."id", "posted_at"
+                FROM "api_post" INNER JOIN "api_friendship"
+                    ON "api_friendship"."requested_by_id" = "api_post"."author_id"
+                WHERE "accepted_at" IS NOT NULL
+                UNION ALL
+                SELECT gen_random_uuid(), "requested_by_id", "api_post"."id", "posted_at"
+                FROM "api_post" INNER JOIN "api_friendship"
+                    ON "api_friendship"."accepted_by_id" = "api_post"."author_id"
+                WHERE "accepted_at" IS NOT NULL
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(
+            """
+                UPDATE "api_post" SET
+                    "like_count" = (
+                        SELECT COUNT(*) FROM "api_postlike"
+                        WHERE "api_postlike"."post_id" = "api_post"."id"
+                    ),
+                    "comment_count" = (
+                        SELECT COUNT(*) FROM "api_postcomment"
+                        WHERE "api_postcomment"."post_id" = "api_post"."id"
+                    )
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
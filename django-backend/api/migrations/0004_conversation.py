@@ -0,0 +1,90 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:32
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_post_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('last_message_at', models.DateTimeField()),
+                ('last_message', models.TextField()),
+                ('unread_count', models.PositiveIntegerField(default=0)),
+                ('friend', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.user')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations', to='api.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-last_message_at'], name='conversation_user_last_at')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_conversation'),
+        ),
+        # Summarize the chats of the already existing messages
+        migrations.RunSQL(
+            """
+                INSERT INTO "api_conversation"
+                    ("id", "user_id", "friend_id", "last_message_at", "last_message", "unread_count")
+                SELECT
+                    gen_random_uuid(),
+                    "user_id",
+                    "friend_id",
+                    "sent_at",
+                    "content",
+                    "unread_count"
+                FROM (
+                    SELECT DISTINCT ON ("user_id", "friend_id")
+                        "user_id",
+                        "friend_id",
+                        "sent_at",
+                        "content",
+                        COUNT(*) FILTER (WHERE "unread")
+                            OVER (PARTITION BY "user_id", "friend_id") AS "unread_count"
+                    FROM (
+                        SELECT
+                            "sender_id" AS "user_id",
+                            "recipient_id" AS "friend_id",
+                            "sent_at",
+                            CONCAT (
+                                'You: ',
+                                CASE
+                                    WHEN "content" = ''
+                                        THEN '📎 Attachment'
+                                    ELSE
+                                        "content"
+                                END
+                            ) AS "content",
+                            false AS "unread"
+                        FROM
+                            "api_message"
+                        UNION ALL
+                        SELECT
+                            "recipient_id" AS "user_id",
+                            "sender_id" AS "friend_id",
+                            "sent_at",
+                            CASE
+                                WHEN "content" = ''
+                                    THEN '📎 Attachment'
+                                ELSE
+                                    "content"
+                            END AS "content",
+                            NOT "read" AS "unread"
+                        FROM
+                            "api_message"
+                    ) AS "sides"
+                    ORDER BY "user_id", "friend_id", "sent_at" DESC
+                ) AS "latest"
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_conversation'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='user',
+            name='channel',
+        ),
+    ]
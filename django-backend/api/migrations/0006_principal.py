@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:36
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_remove_user_channel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Principal',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('api.user',),
+        ),
+    ]
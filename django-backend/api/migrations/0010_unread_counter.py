@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UnreadCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='unread_counter', serialize=False, to='api.user')),
+                ('messages', models.PositiveIntegerField(default=0)),
+                ('notifications', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            """
+                INSERT INTO "api_unreadcounter" ("user_id", "messages", "notifications")
+                SELECT
+                    "api_user"."id",
+                    (
+                        SELECT COUNT(*) FROM "api_message"
+                        WHERE "api_message"."recipient_id" = "api_user"."id"
+                            AND NOT "api_message"."read"
+                    ),
+                    (
+                        SELECT COUNT(*) FROM "api_notification"
+                        WHERE "api_notification"."recipient_id" = "api_user"."id"
+                            AND NOT "api_notification"."read"
+                    )
+                FROM "api_user"
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
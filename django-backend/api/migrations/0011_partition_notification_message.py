@@ -0,0 +1,81 @@
+from datetime import date
+
+from django.db import migrations
+from django.utils import timezone
+
+
+# The tables, the column they are partitioned by and their foreign keys to the users.
+# The SQL is written out here, so the migration doesn't change with the code that
+# maintains the partitions. The partition names are the ones `api.partitions` uses.
+TABLES = {
+    "api_notification": ("created_at", ["recipient_id"]),
+    "api_message": ("sent_at", ["sender_id", "recipient_id"]),
+}
+
+
+def month_start(day: date, months: int = 0) -> date:
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_tables(apps, schema_editor):
+    """
+    Rebuilds the notification and message tables as tables partitioned by month.
+    Nothing references them, so they are copied and swapped. The primary key
+    includes the partition column, as Postgres requires.
+    """
+
+    with schema_editor.connection.cursor() as cursor:
+        for table, (column, foreign_keys) in TABLES.items():
+            partitioned = f"{table}_partitioned"
+            cursor.execute(
+                f"""
+                    CREATE TABLE "{partitioned}"
+                    (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+                    PARTITION BY RANGE ("{column}")
+                """
+            )
+            cursor.execute(
+                f'CREATE TABLE "{table}_default" PARTITION OF "{partitioned}" DEFAULT'
+            )
+
+            cursor.execute(f'SELECT MIN("{column}") FROM "{table}"')
+            oldest = cursor.fetchone()[0] or timezone.now()
+            month, last = month_start(oldest), month_start(timezone.now(), 3)
+            while month <= last:
+                cursor.execute(
+                    f"""
+                        CREATE TABLE "{table}_y{month.year}m{month.month:02}"
+                        PARTITION OF "{partitioned}" FOR VALUES FROM (%s) TO (%s)
+                    """,
+                    [month, month_start(month, 1)],
+                )
+                month = month_start(month, 1)
+
+            cursor.execute(f'INSERT INTO "{partitioned}" SELECT * FROM "{table}"')
+            cursor.execute(f'DROP TABLE "{table}"')
+            cursor.execute(f'ALTER TABLE "{partitioned}" RENAME TO "{table}"')
+            cursor.execute(
+                f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" '
+                f'PRIMARY KEY ("id", "{column}")'
+            )
+
+            # The foreign keys and their indexes are recreated as Django creates them
+            for key in foreign_keys:
+                cursor.execute(
+                    f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_{key}_fk_api_user_id" '
+                    f'FOREIGN KEY ("{key}") REFERENCES "api_user" ("id") '
+                    f"DEFERRABLE INITIALLY DEFERRED"
+                )
+                cursor.execute(f'CREATE INDEX "{table}_{key}_idx" ON "{table}" ("{key}")')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_unread_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_tables),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.0.7 on 2026-10-18 04:51
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The indexes are built concurrently where Postgres allows it, it doesn't on partitioned tables
+    atomic = False
+
+    dependencies = [
+        ('api', '0011_partition_notification_message'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='friendship',
+            index=models.Index(condition=models.Q(('accepted_at__isnull', False)), fields=['accepted_by', 'requested_by'], name='friendship_accepted_received'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'recipient', '-sent_at'], name='message_sender_recipient_sent'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient', 'sender'], name='message_unread'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at'], name='notification_recipient_created'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['recipient', 'type', '-created_at'], name='notification_unread_type'),
+        ),
+        AddIndexConcurrently(
+            model_name='postcomment',
+            index=models.Index(fields=['post', '-commented_at'], name='postcomment_post_commented'),
+        ),
+        # Concurrent likes could insert the same like twice, the extra ones are uncounted
+        migrations.RunSQL(
+            """
+                WITH "duplicates" AS (
+                    DELETE FROM "api_postlike" AS "like"
+                    USING "api_postlike" AS "kept"
+                    WHERE
+                        "kept"."post_id" = "like"."post_id"
+                        AND "kept"."liked_by_id" = "like"."liked_by_id"
+                        AND "kept"."id" < "like"."id"
+                    RETURNING "like"."post_id"
+                )
+                UPDATE "api_post"
+                SET "like_count" = GREATEST("like_count" - "removed"."count", 0)
+                FROM (
+                    SELECT "post_id", COUNT(*) AS "count" FROM "duplicates" GROUP BY "post_id"
+                ) AS "removed"
+                WHERE "api_post"."id" = "removed"."post_id"
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    'CREATE UNIQUE INDEX CONCURRENTLY "postlike_post_liked_by" '
+                    'ON "api_postlike" ("post_id", "liked_by_id")',
+                    # Dropping the constraint drops its index
+                    migrations.RunSQL.noop,
+                ),
+                migrations.RunSQL(
+                    'ALTER TABLE "api_postlike" ADD CONSTRAINT "postlike_post_liked_by" '
+                    'UNIQUE USING INDEX "postlike_post_liked_by"',
+                    'ALTER TABLE "api_postlike" DROP CONSTRAINT "postlike_post_liked_by"',
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='postlike',
+                    constraint=models.UniqueConstraint(fields=('post', 'liked_by'), name='postlike_post_liked_by'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-18 05:06
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MutualFriendCount',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mutual_friend_counts', to='api.user')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-count'], name='mutualfriend_user_count')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='mutualfriendcount',
+            constraint=models.UniqueConstraint(fields=('user', 'other'), name='unique_mutual_friend_count'),
+        ),
+        # Count the mutual friends of the already accepted friendships
+        migrations.RunSQL(
+            """
+                WITH "edges" AS (
+                    SELECT "requested_by_id" AS "user_id", "accepted_by_id" AS "friend_id"
+                    FROM "api_friendship" WHERE "accepted_at" IS NOT NULL
+                    UNION ALL
+                    SELECT "accepted_by_id", "requested_by_id"
+                    FROM "api_friendship" WHERE "accepted_at" IS NOT NULL
+                )
+                INSERT INTO "api_mutualfriendcount" ("id", "user_id", "other_id", "count")
+                SELECT gen_random_uuid(), "mine"."user_id", "theirs"."friend_id", COUNT(*)
+                FROM "edges" AS "mine"
+                JOIN "edges" AS "theirs" ON "theirs"."user_id" = "mine"."friend_id"
+                WHERE "theirs"."friend_id" <> "mine"."user_id"
+                GROUP BY "mine"."user_id", "theirs"."friend_id"
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
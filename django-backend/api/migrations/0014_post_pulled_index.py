@@ -0,0 +1,19 @@
+# Generated by Django 5.0.7 on 2026-10-18 05:18
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('api', '0013_mutual_friend_count'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-posted_at'], name='post_pulled_author_posted'),
+        ),
+    ]
@@ -1,13 +1,41 @@
+from typing import FrozenSet
+import os
 import uuid
 
+from django.conf import settings
 from django.contrib.postgres.expressions import ArraySubquery
-from django.db.models import Count, OuterRef, Exists
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import OuterRef, Exists
+from django.db.models.functions import Upper
 from django.core.exceptions import ValidationError
 from django.core.validators import EmailValidator
-from django.db import models
+from django.db import models, transaction
+
+from api.caches import LocalCache
+
+# The friend ids by user id, the worker that changes a friendship writes them through,
+# the other workers see the change after the TTL at most
+friends_cache = LocalCache(settings.FRIENDS_CACHE_SIZE, settings.FRIENDS_CACHE_TTL)
 
 
 class User(models.Model):
+    class Meta:
+        indexes = [
+            # Trigram indexes serve the icontains search on names, the pattern index the email prefix
+            GinIndex(
+                OpClass(Upper("first_name"), name="gin_trgm_ops"),
+                name="user_first_name_trgm",
+            ),
+            GinIndex(
+                OpClass(Upper("last_name"), name="gin_trgm_ops"),
+                name="user_last_name_trgm",
+            ),
+            models.Index(
+                OpClass(Upper("email"), name="text_pattern_ops"),
+                name="user_email_prefix",
+            ),
+        ]
+
     class Genders(models.TextChoices):
         MALE = "MALE", "Male"
         FEMALE = "FEMALE", "Female"
@@ -31,6 +59,8 @@ class User(models.Model):
     last_name = models.CharField(max_length=255)
     profile_image = models.ImageField(upload_to="public/", null=True, blank=True)
     background_image = models.ImageField(upload_to="public/", null=True, blank=True)
+    profile_image_variants = models.JSONField(default=dict, blank=True)
+    background_image_variants = models.JSONField(default=dict, blank=True)
     gender = models.CharField(
         max_length=255, null=True, blank=True, choices=Genders.choices
     )
@@ -42,9 +72,33 @@ class User(models.Model):
     occupation = models.CharField(max_length=255, null=True, blank=True)
     education = models.CharField(max_length=255, null=True, blank=True)
     hobbies = models.CharField(max_length=255, null=True, blank=True)
-    channel = models.CharField(max_length=255, null=True, blank=True)
 
-    def friends(self):
+    def friends(self) -> FrozenSet[uuid.UUID]:
+        """
+        Returns the ids of the user's friends.
+        The ids are cached per worker and rebuilt from the database on a cache miss.
+        """
+
+        if (friend_ids := friends_cache.get(self.id)) is not None:
+            return friend_ids
+
+        friend_ids = frozenset(self._friends_queryset())
+        friends_cache.set(self.id, friend_ids)
+        return friend_ids
+
+    async def afriends(self) -> FrozenSet[uuid.UUID]:
+        """
+        Async version of `friends`.
+        """
+
+        if (friend_ids := friends_cache.get(self.id)) is not None:
+            return friend_ids
+
+        friend_ids = frozenset([id async for id in self._friends_queryset()])
+        friends_cache.set(self.id, friend_ids)
+        return friend_ids
+
+    def _friends_queryset(self):
         friends_requested = Friendship.objects.filter(
             requested_by=self, accepted_at__isnull=False
         ).values_list("accepted_by", flat=True)
@@ -53,6 +107,40 @@ class User(models.Model):
         ).values_list("requested_by", flat=True)
         return friends_requested.union(friends_accepted)
 
+    @staticmethod
+    def refresh_friends(*user_ids: uuid.UUID):
+        """
+        Updates the cached friend ids of the given users, it must be called
+        whenever a friendship of theirs is accepted or removed. The old ids are dropped
+        at once and the new ones are written through when the transaction commits,
+        so a set read before the commit doesn't stay cached.
+        """
+
+        for id in user_ids:
+            friends_cache.invalidate(id)
+
+        def write_through():
+            for id in user_ids:
+                friends_cache.set(id, frozenset(User(id=id)._friends_queryset()))
+
+        transaction.on_commit(write_through)
+
+
+class Principal(User):
+    """
+    The authenticated user as built from the few cached fields most views need.
+    Reading any other field loads all the missing ones with a single query.
+    """
+
+    class Meta:
+        proxy = True
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        deferred_fields = self.get_deferred_fields()
+        if fields is not None and deferred_fields.intersection(fields):
+            fields = deferred_fields.union(fields)
+        super().refresh_from_db(using, fields, **kwargs)
+
 
 class Friendship(models.Model):
     class Meta:
@@ -61,6 +149,14 @@ class Friendship(models.Model):
                 fields=["requested_by", "accepted_by"], name="unique_friendship"
             )
         ]
+        indexes = [
+            # The friends of a user from the accepting side, `unique_friendship` covers the other
+            models.Index(
+                fields=["accepted_by", "requested_by"],
+                condition=models.Q(accepted_at__isnull=False),
+                name="friendship_accepted_received",
+            ),
+        ]
 
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     requested_by = models.ForeignKey(
@@ -72,45 +168,123 @@ class Friendship(models.Model):
     accepted_at = models.DateTimeField(null=True, blank=True, default=None)
 
 
+class MutualFriendCount(models.Model):
+    """
+    The mutual friends of two users, kept for both orders of every pair with any,
+    so the suggestions and the mutual counts are read from an index instead of a graph walk.
+    The counts are updated when a friendship is accepted or removed,
+    `manage.py rebuild_mutual_friends` recounts all of them.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "other"], name="unique_mutual_friend_count"
+            )
+        ]
+        indexes = [
+            models.Index(fields=["user", "-count"], name="mutualfriend_user_count")
+        ]
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    other = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="mutual_friend_counts"
+    )
+    count = models.PositiveIntegerField(default=0)
+
+
 class Post(models.Model):
+    class Meta:
+        indexes = [
+            # The posts that are pulled into the feeds of the author's friends
+            models.Index(
+                fields=["author", "-posted_at"],
+                condition=models.Q(fanned_out=False),
+                name="post_pulled_author_posted",
+            )
+        ]
+
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="posts")
     posted_at = models.DateTimeField(auto_now_add=True)
     content = models.TextField(max_length=1000, null=True, blank=True)
+    # Posts of authors with too many friends are not pushed to their timelines,
+    # instead they are pulled when the feed is read.
+    fanned_out = models.BooleanField(default=True)
+    # Counters are kept up to date by the views, `manage.py reconcile_post_counters` fixes any drift.
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
 
     @staticmethod
     def include_extra(queryset, request_user):
         return queryset.annotate(
-            comment_count=Count("comments", distinct=True),
-            like_count=Count("likes__id", distinct=True),
             liked=Exists(
                 PostLike.objects.filter(post=OuterRef("id"), liked_by=request_user)
             ),
             file=ArraySubquery(
-                PostFile.objects.filter(post__id=OuterRef("id")).values("file")
+                PostFile.objects.filter(post__id=OuterRef("id"))
+                .order_by("id")
+                .values("file")
+            ),
+            file_variants=ArraySubquery(
+                PostFile.objects.filter(post__id=OuterRef("id"))
+                .order_by("id")
+                .values("file_variants")
             ),
         ).select_related("author")
 
 
+class TimelineEntry(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "post"], name="unique_timeline_entry")
+        ]
+        indexes = [
+            models.Index(fields=["user", "-posted_at"], name="timeline_user_posted_at")
+        ]
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline")
+    posted_at = models.DateTimeField()
+
+
 class PostFile(models.Model):
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="files")
     file = models.FileField(upload_to="public/")
+    file_variants = models.JSONField(default=dict, blank=True)
 
 
 class PostLike(models.Model):
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["post", "liked_by"], name="postlike_post_liked_by"
+            )
+        ]
+
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="likes")
     liked_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name="likes")
 
 
 class PostComment(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "-commented_at"], name="postcomment_post_commented"
+            )
+        ]
+
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="comments")
     commented_at = models.DateTimeField(auto_now_add=True)
     content = models.TextField(null=True, blank=True, max_length=500)
     file = models.FileField(upload_to="public/", null=True, blank=True)
+    file_variants = models.JSONField(default=dict, blank=True)
 
     def clean(self):
         if not self.content and not self.file:
@@ -118,6 +292,20 @@ class PostComment(models.Model):
 
 
 class Notification(models.Model):
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["recipient", "-created_at"],
+                name="notification_recipient_created",
+            ),
+            # The unread notifications that new ones are aggregated into
+            models.Index(
+                fields=["recipient", "type", "-created_at"],
+                condition=models.Q(read=False),
+                name="notification_unread_type",
+            ),
+        ]
+
     class Types(models.TextChoices):
         FRIEND_REQUEST = "FRIEND_REQUEST", "Friend request"
         FRIEND_REQUEST_ACCEPTED = "FRIEND_REQUEST_ACCEPTED", "Friend request accepted"
@@ -125,6 +313,8 @@ class Notification(models.Model):
         POST_LIKED = "POST_LIKED", "Post like"
         POST_COMMENTED = "POST_COMMENTED", "Post commented"
 
+    # The table is partitioned by month on created_at (migration 0011), so its primary key
+    # in the database is (id, created_at). Django only knows id, which is unique on its own.
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     recipient = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="notifications"
@@ -136,6 +326,22 @@ class Notification(models.Model):
 
 
 class Message(models.Model):
+    class Meta:
+        indexes = [
+            # The chat of two users is the union of both directions
+            models.Index(
+                fields=["sender", "recipient", "-sent_at"],
+                name="message_sender_recipient_sent",
+            ),
+            models.Index(
+                fields=["recipient", "sender"],
+                condition=models.Q(read=False),
+                name="message_unread",
+            ),
+        ]
+
+    # The table is partitioned by month on sent_at (migration 0011), so its primary key
+    # in the database is (id, sent_at). Django only knows id, which is unique on its own.
     id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
     sender = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="sent_messages"
@@ -146,8 +352,67 @@ class Message(models.Model):
     sent_at = models.DateTimeField(auto_now_add=True)
     content = models.TextField(max_length=1000)
     file = models.FileField(upload_to="private/", null=True, blank=True)
+    file_variants = models.JSONField(default=dict, blank=True)
     read = models.BooleanField(default=False)
 
     def clean(self):
         if not self.content and not self.file:
             raise ValidationError("Message content or file is required")
+
+
+class Conversation(models.Model):
+    """
+    The summary of a chat as seen by one of its two participants,
+    every pair of users that exchanged messages has one conversation per side.
+    """
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "friend"], name="unique_conversation")
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-last_message_at"], name="conversation_user_last_at"
+            )
+        ]
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="conversations"
+    )
+    friend = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    last_message_at = models.DateTimeField()
+    last_message = models.TextField()
+    unread_count = models.PositiveIntegerField(default=0)
+
+
+class UnreadCounter(models.Model):
+    """
+    The unread messages and notifications of a user, kept up to date when they are
+    created and read, so the counts are read without counting the history.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="unread_counter"
+    )
+    messages = models.PositiveIntegerField(default=0)
+    notifications = models.PositiveIntegerField(default=0)
+
+
+class Upload(models.Model):
+    """
+    A file that is uploaded in chunks, it's stored in `UPLOAD_ROOT` until
+    a post, comment or message takes it.
+    """
+
+    id = models.UUIDField(primary_key=True, editable=False, default=uuid.uuid4)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploads")
+    created_at = models.DateTimeField(auto_now_add=True)
+    content_type = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.UPLOAD_ROOT, self.id.hex)
@@ -0,0 +1,144 @@
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+import base64
+import binascii
+import json
+import uuid
+
+from django.db.models import Model, Q, QuerySet
+from ninja import Field, Schema
+from ninja.conf import settings
+from ninja.errors import HttpError
+from ninja.pagination import PageNumberPagination
+
+
+class CursorPagination(PageNumberPagination):
+    """
+    Keyset pagination over (ordering_field, id) from the newest to the oldest item.
+    It doesn't count the items and doesn't scan the skipped ones, so every page costs the same.
+
+    Clients opt in by sending the `cursor` query parameter, an empty cursor returns the first page.
+    Without it the page number pagination is used, so old clients keep working.
+    """
+
+    class Input(Schema):
+        page: int = Field(1, ge=1)
+        cursor: Optional[str] = None
+
+    class Output(Schema):
+        items: List[Any]
+        count: Optional[int] = None
+        next: Optional[str] = None
+        previous: Optional[str] = None
+
+    def __init__(
+        self,
+        ordering_field: str,
+        page_size: int = settings.PAGINATION_PER_PAGE,
+        **kwargs: Any,
+    ) -> None:
+        self.ordering_field = ordering_field
+        super().__init__(page_size=page_size, **kwargs)
+
+    def paginate_queryset(
+        self, queryset: QuerySet, pagination: Input, **params: Any
+    ) -> Any:
+        if pagination.cursor is None:
+            return super().paginate_queryset(queryset, pagination, **params)
+
+        page, forward = self._page_queryset(queryset, pagination.cursor)
+        return self._page(list(page), forward, pagination.cursor)
+
+    async def apaginate_queryset(
+        self, queryset: QuerySet, pagination: Input, **params: Any
+    ) -> Any:
+        if pagination.cursor is None:
+            # ninja iterates the page synchronously, so it's fetched here
+            result = await super().apaginate_queryset(queryset, pagination, **params)
+            result["items"] = [item async for item in result["items"]]
+            return result
+
+        page, forward = self._page_queryset(queryset, pagination.cursor)
+        return self._page([item async for item in page], forward, pagination.cursor)
+
+    def _page_queryset(self, queryset: QuerySet, cursor: str) -> Tuple[QuerySet, bool]:
+        """
+        Returns the queryset of the page after (or before) the cursor, with one extra item
+        to know if there are more pages, and whether the page is read forward.
+        """
+
+        return keyset(queryset, cursor, self.ordering_field, self.page_size + 1)
+
+    def _page(self, items: List[Model], forward: bool, cursor: str) -> dict:
+        has_more = len(items) > self.page_size
+        items = items[: self.page_size]
+        if not forward:
+            items.reverse()
+
+        return {
+            "items": items,
+            "next": (
+                self._encode_cursor(items[-1], True)
+                if items and (has_more or not forward)
+                else None
+            ),
+            "previous": (
+                self._encode_cursor(items[0], False)
+                if items and cursor and (has_more or forward)
+                else None
+            ),
+        }
+
+    def _encode_cursor(self, item: Model, forward: bool) -> str:
+        value = getattr(item, self.ordering_field)
+        payload = json.dumps([value.isoformat(), str(item.id), forward])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def keyset(
+    queryset: QuerySet,
+    cursor: str,
+    ordering_field: str,
+    size: int = settings.PAGINATION_PER_PAGE + 1,
+    id_field: str = "id",
+) -> Tuple[QuerySet, bool]:
+    """
+    This function returns the first items of a queryset after (or before) a cursor of
+    `CursorPagination`, and whether they are read forward. The id of the cursor can be
+    matched against another field, e.g. to page rows that reference the paginated items.
+
+    Args:
+        queryset (QuerySet): The queryset to page.
+        cursor (str): The cursor, empty for the first page.
+        ordering_field (str): The field the items are ordered by.
+        size (int): How many items to return.
+        id_field (str): The field that holds the id of the paginated item.
+
+    Returns:
+        Tuple[QuerySet, bool]: The items in page order and whether the page is read forward.
+    """
+
+    if not cursor:
+        return queryset.order_by(f"-{ordering_field}", f"-{id_field}")[:size], True
+
+    value, id, forward = decode_cursor(cursor)
+    if forward:
+        queryset = queryset.filter(
+            Q(**{f"{ordering_field}__lt": value})
+            | Q(**{ordering_field: value, f"{id_field}__lt": id})
+        ).order_by(f"-{ordering_field}", f"-{id_field}")
+    else:
+        queryset = queryset.filter(
+            Q(**{f"{ordering_field}__gt": value})
+            | Q(**{ordering_field: value, f"{id_field}__gt": id})
+        ).order_by(ordering_field, id_field)
+
+    return queryset[:size], forward
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID, bool]:
+    try:
+        value, id, forward = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(value), uuid.UUID(id), bool(forward)
+    except (binascii.Error, ValueError, TypeError, AttributeError):
+        raise HttpError(400, "Invalid cursor")
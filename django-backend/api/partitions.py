@@ -0,0 +1,116 @@
+"""
+The notifications and the messages are stored in tables partitioned by month.
+Every table has a default partition, so rows are never rejected if a month's partition is missing.
+"""
+
+from datetime import date
+from typing import List
+
+
+# The partitioned tables and the column they are partitioned by
+PARTITIONED_TABLES = {
+    "api_notification": "created_at",
+    "api_message": "sent_at",
+}
+
+
+def month_start(day: date, months: int = 0) -> date:
+    """
+    Returns the first day of the month that is `months` after the month of the day.
+    """
+
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02}"
+
+
+def create_partition(cursor, table: str, month: date, parent: str | None = None) -> bool:
+    """
+    This function creates the partition of a month if it doesn't exist. The rows of the month
+    that are in the default partition are moved to it, so it can be attached.
+
+    Args:
+        cursor: A database cursor.
+        table (str): The partitioned table, it's also the prefix of the partition name.
+        month (date): The first day of the month.
+        parent (str | None): The table to attach the partition to, if it isn't `table`.
+
+    Returns:
+        bool: Whether the partition was created.
+    """
+
+    parent = parent or table
+    name = partition_name(table, month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0]:
+        return False
+
+    column = PARTITIONED_TABLES[table]
+    bounds = [month, month_start(month, 1)]
+    cursor.execute(
+        f'CREATE TABLE "{name}" (LIKE "{parent}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+    )
+    cursor.execute(
+        f"""
+            WITH "moved" AS (
+                DELETE FROM "{table}_default"
+                WHERE "{column}" >= %s AND "{column}" < %s
+                RETURNING *
+            )
+            INSERT INTO "{name}" SELECT * FROM "moved"
+        """,
+        bounds,
+    )
+    cursor.execute(
+        f'ALTER TABLE "{parent}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+        bounds,
+    )
+    return True
+
+
+def partition_months(cursor, table: str) -> List[date]:
+    """
+    Returns the months of the attached partitions of a table, from the oldest to the newest.
+    """
+
+    cursor.execute(
+        """
+            SELECT "child"."relname" FROM "pg_inherits"
+            JOIN "pg_class" AS "parent" ON "parent"."oid" = "pg_inherits"."inhparent"
+            JOIN "pg_class" AS "child" ON "child"."oid" = "pg_inherits"."inhrelid"
+            WHERE "parent"."relname" = %s
+        """,
+        [table],
+    )
+
+    months = []
+    for (name,) in cursor.fetchall():
+        suffix = name.removeprefix(f"{table}_y")
+        if suffix != name:
+            year, month = suffix.split("m")
+            months.append(date(int(year), int(month), 1))
+    return sorted(months)
+
+
+def detach_partition(cursor, table: str, month: date, archive: bool):
+    """
+    This function removes the partition of a month from the table, which is instant
+    unlike deleting its rows. The partition is kept as a standalone archive table
+    (e.g. archive_api_notification_y2024m01) or dropped.
+
+    Args:
+        cursor: A database cursor.
+        table (str): The partitioned table.
+        month (date): The first day of the month.
+        archive (bool): Whether the partition is kept.
+    """
+
+    name = partition_name(table, month)
+    cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+    if archive:
+        cursor.execute(f'ALTER TABLE "{name}" RENAME TO "archive_{name}"')
+    else:
+        cursor.execute(f'DROP TABLE "{name}"')
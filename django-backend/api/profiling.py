@@ -0,0 +1,213 @@
+"""
+Opt-in profiling of the ninja operations with cProfile. A request is profiled when it sends
+the `X-Profile` header with `PROFILE_SECRET`, or at random with `PROFILE_SAMPLE_RATE`.
+The profiles are saved per operation id in `PROFILE_DIR`, only the newest `PROFILE_KEEP` are kept,
+and they can be opened with `python -m pstats` or summarized by the profile router.
+
+Async operations are profiled only while their own coroutine runs. The profiler is paused
+whenever it awaits, so the other requests the event loop runs meanwhile aren't in its profile,
+and neither is the work it awaits in other threads, e.g. its SQL in `sync_to_async`.
+"""
+
+from functools import wraps
+from typing import Any, Callable, Coroutine, Dict, Generator, List, Set
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import time
+import types
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import HttpRequest
+from ninja import NinjaAPI
+
+from api.metrics import operation_id, operations
+
+
+PROFILE_HEADER = "X-Profile"
+
+# The ids of the profiled operations, the profiles are saved in directories named after them
+operation_ids: Set[str] = set()
+
+# A thread can run one profiler at a time, the requests that come while it's busy aren't profiled
+_profiling = threading.Lock()
+
+
+def has_profile_access(request: HttpRequest) -> bool:
+    """
+    Returns whether the request sent the profiling secret, there is no access without one.
+    """
+
+    secret, header = settings.PROFILE_SECRET, request.headers.get(PROFILE_HEADER)
+    return bool(secret and header and hmac.compare_digest(header, secret))
+
+
+def wants_profile(request: HttpRequest) -> bool:
+    return has_profile_access(request) or random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def profile_operations(api: NinjaAPI):
+    """
+    This function wraps every operation of the api, so the requests that want it are profiled.
+    The profile of a request is named in its `X-Profile` response header.
+
+    Args:
+        api (NinjaAPI): The api, after all its routers are added.
+    """
+
+    for op in operations(api):
+        operation_ids.add(operation_id(api, op))
+        op.run = profiled(op.run, operation_id(api, op))
+
+
+def profiled(run: Callable, operation_id: str) -> Callable:
+    if iscoroutinefunction(run):
+
+        @wraps(run)
+        async def async_run(request, *args, **kwargs):
+            if not wants_profile(request) or not _profiling.acquire(blocking=False):
+                return await run(request, *args, **kwargs)
+
+            profiler = cProfile.Profile()
+            try:
+                response = await profile_steps(profiler, run(request, *args, **kwargs))
+            finally:
+                _profiling.release()
+            response[PROFILE_HEADER] = save_profile(profiler, operation_id)
+            return response
+
+        return async_run
+
+    @wraps(run)
+    def sync_run(request, *args, **kwargs):
+        if not wants_profile(request) or not _profiling.acquire(blocking=False):
+            return run(request, *args, **kwargs)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            response = run(request, *args, **kwargs)
+        finally:
+            profiler.disable()
+            _profiling.release()
+        response[PROFILE_HEADER] = save_profile(profiler, operation_id)
+        return response
+
+    return sync_run
+
+
+@types.coroutine
+def profile_steps(profiler: cProfile.Profile, coroutine: Coroutine) -> Generator:
+    """
+    This function runs the coroutine and profiles only its steps, it passes what
+    the coroutine awaits to the event loop with the profiler paused.
+
+    Args:
+        profiler (cProfile.Profile): The profiler.
+        coroutine (Coroutine): The coroutine to run.
+
+    Returns:
+        Generator: A generator-based coroutine that returns what the coroutine returns.
+    """
+
+    value, error = None, None
+    while True:
+        profiler.enable()
+        try:
+            if error is None:
+                awaited = coroutine.send(value)
+            else:
+                awaited = coroutine.throw(error)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            profiler.disable()
+
+        try:
+            value, error = (yield awaited), None
+        except BaseException as e:
+            value, error = None, e
+
+
+def save_profile(profiler: cProfile.Profile, operation_id: str) -> str:
+    """
+    This function saves a profile in the directory of its operation and deletes
+    the oldest profiles of the operation beyond `PROFILE_KEEP`.
+
+    Args:
+        profiler (cProfile.Profile): The finished profiler.
+        operation_id (str): The id of the profiled operation.
+
+    Returns:
+        str: The path of the profile relative to `PROFILE_DIR`.
+    """
+
+    directory = os.path.join(settings.PROFILE_DIR, operation_id)
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.join(operation_id, f"{time.time_ns()}-{os.getpid()}.prof")
+    profiler.dump_stats(os.path.join(settings.PROFILE_DIR, name))
+
+    for path in recent_profiles(operation_id)[settings.PROFILE_KEEP :]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass  # Another worker rotated it
+
+    return name
+
+
+def recent_profiles(operation_id: str | None = None) -> List[str]:
+    """
+    Returns the paths of the saved profiles from the newest to the oldest,
+    of one operation or of all of them.
+    """
+
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+
+    directories = [operation_id] if operation_id else os.listdir(settings.PROFILE_DIR)
+    profiles = []
+    for directory in directories:
+        path = os.path.join(settings.PROFILE_DIR, directory)
+        if os.path.isdir(path):
+            profiles += [
+                (name, os.path.join(path, name))
+                for name in os.listdir(path)
+                if name.endswith(".prof")
+            ]
+
+    # The names start with the time in nanoseconds
+    return [path for _, path in sorted(profiles, reverse=True)]
+
+
+def summarize(paths: List[str], limit: int) -> List[Dict[str, Any]]:
+    """
+    This function adds up the profiles and returns their top functions by cumulative time.
+
+    Args:
+        paths (List[str]): The profile paths.
+        limit (int): How many functions to return.
+
+    Returns:
+        List[Dict[str, Any]]: The functions with their calls, own time and cumulative time,
+        the times are the totals of all the profiles in seconds.
+    """
+
+    if not paths:
+        return []
+
+    stats = pstats.Stats(*paths).stats
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{file}:{line}({name})",
+            "calls": calls,
+            "total_time": round(total, 6),
+            "cumulative_time": round(cumulative, 6),
+        }
+        for (file, line, name), (_, calls, total, cumulative, _) in top
+    ]
@@ -1,11 +1,24 @@
 from datetime import datetime
-from typing import Optional, List
-
-from pydantic import EmailStr, Field, UUID4
-from django.db.models import Q
-
-from api.helpers import CamelCaseModelSchema, CamelCaseSchema, CamelCaseFilterSchema
-from api.models import User, Notification, Friendship, Message, Post, PostComment
+from typing import Dict, Optional, List
+
+from pydantic import EmailStr, Field, UUID4, model_validator
+
+from api.auth import sign_private_file
+from api.helpers import (
+    CamelCaseModelSchema,
+    CamelCaseSchema,
+    CamelCaseFilterSchema,
+    sign_variants,
+)
+from api.loaders import friendship_statuses, mutual_friend_counts
+from api.models import (
+    User,
+    Notification,
+    Message,
+    Post,
+    PostComment,
+    Upload,
+)
 
 
 class UserRegisterIn(*CamelCaseModelSchema):
@@ -43,9 +56,10 @@ class UserUpdateIn(*CamelCaseModelSchema):
             "id",
             "profile_image",
             "background_image",
+            "profile_image_variants",
+            "background_image_variants",
             "joined_at",
             "last_active",
-            "channel"
         ]
         fields_optional = "__all__"
 
@@ -56,34 +70,47 @@ class UserUpdateIn(*CamelCaseModelSchema):
 class UserOutMulti(*CamelCaseModelSchema):
     class Meta:
         model = User
-        exclude = ["password", "channel"]
+        exclude = ["password"]
 
 
 class UserOutSingle(UserOutMulti):
     friendship_status: str
+    mutual_friends: int
 
     @staticmethod
     def resolve_friendship_status(user, context):
-        auth_user = context["request"].auth
-        friendship = Friendship.objects.filter(
-            (Q(requested_by=auth_user, accepted_by=user))
-            | Q(requested_by=user, accepted_by=auth_user)
-        ).first()
+        return friendship_statuses(context["request"]).get(user.id)
+
+    @staticmethod
+    def resolve_mutual_friends(user, context):
+        return mutual_friend_counts(context["request"]).get(user.id)
 
-        return (
-            "stranger"
-            if not friendship
-            else (
-                "friend"
-                if friendship.accepted_at
-                else "requested" if friendship.requested_by == auth_user else "received"
-            )
-        )
+
+class UserSuggestionOut(UserOutMulti):
+    mutual_friends: int
+
+
+class UserOutPartial(*CamelCaseModelSchema):
+    class Meta:
+        model = User
+        exclude = ["password"]
+        fields_optional = "__all__"
+
+    friendship_status: Optional[str] = None
+
+    # Only the fields loaded on the user are set, the deferred ones aren't loaded
+    # one query per user, so routes with `exclude_unset` return the projected fields
+    @model_validator(mode="wrap")
+    @classmethod
+    def loaded_fields(cls, user, handler):
+        if isinstance(user, User):
+            user = {key: getattr(user, key) for key in vars(user) if key[0] != "_"}
+        return handler(user)
 
 
 class UserSearchIn(*CamelCaseFilterSchema):
     query: str = Field(
-        None, q=["first_name__icontains", "last_name__icontains", "email__icontains"]
+        None, q=["first_name__icontains", "last_name__icontains", "email__istartswith"]
     )
 
 
@@ -96,6 +123,7 @@ class NotificationOut(*CamelCaseModelSchema):
 class MessageIn(*CamelCaseSchema):
     recipient_id: UUID4
     content: Optional[str] = ""
+    upload: Optional[UUID4] = None
 
 
 class MessageOut(*CamelCaseModelSchema):
@@ -105,6 +133,20 @@ class MessageOut(*CamelCaseModelSchema):
 
     sender_id: UUID4
     recipient_id: UUID4
+    file: Optional[str] = None
+    file_variants: Dict[str, Dict] = {}
+
+    @staticmethod
+    def resolve_file(message, context):
+        return (
+            sign_private_file(message.file.name, context["request"].auth.id)
+            if message.file
+            else None
+        )
+
+    @staticmethod
+    def resolve_file_variants(message, context):
+        return sign_variants(message.file_variants, context["request"].auth.id)
 
 
 class ChatOut(*CamelCaseSchema):
@@ -124,6 +166,8 @@ class PostIn(*CamelCaseModelSchema):
         fields = ["content"]
         optional_fields = ["content"]
 
+    uploads: List[UUID4] = []
+
 
 class PostOutMinimal(*CamelCaseModelSchema):
     class Meta:
@@ -135,11 +179,13 @@ class PostOut(*CamelCaseModelSchema):
     class Meta:
         model = Post
         fields = "__all__"
+        exclude = ["fanned_out"]
 
     comment_count: int = Field(None, serialization_alias="comments")
     like_count: int = Field(None, serialization_alias="likes")
     author: UserOutMulti
     file: List[str] = Field(None, serialization_alias="files")
+    file_variants: List[Dict[str, Dict]] = None
     liked: bool
 
 
@@ -156,3 +202,26 @@ class CommentOut(*CamelCaseModelSchema):
         exclude = ["post", "author"]
 
     author: UserOutMulti
+
+
+class UploadIn(*CamelCaseSchema):
+    content_type: str
+    size: int = Field(..., gt=0)
+
+
+class UploadOut(*CamelCaseModelSchema):
+    class Meta:
+        model = Upload
+        fields = ["id", "content_type", "size", "received", "completed"]
+
+
+class ProfileFunctionOut(*CamelCaseSchema):
+    function: str
+    calls: int
+    total_time: float
+    cumulative_time: float
+
+
+class ProfileSummaryOut(*CamelCaseSchema):
+    samples: int
+    functions: List[ProfileFunctionOut]
@@ -0,0 +1,141 @@
+"""
+The slow-query log. Every database connection gets an execute wrapper that appends the statements
+slower than `SLOW_QUERY_THRESHOLD` to `SLOW_QUERY_LOG`, one JSON object per line, with their
+parameters, duration and operation. With `SLOW_QUERY_EXPLAIN` the SELECTs are also run again
+with EXPLAIN (ANALYZE, BUFFERS) and their plan is logged, `manage.py slow_queries` ranks them.
+"""
+
+from typing import Any, Dict
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from api.metrics import current_metrics
+
+
+MAX_PARAMS_LENGTH = 2000
+
+_writing = threading.Lock()
+
+
+def record_slow_query(execute, sql, params, many, context):
+    """
+    An execute wrapper that logs the statement if it's slower than the threshold,
+    the statements that fail aren't logged.
+    """
+
+    if settings.SLOW_QUERY_THRESHOLD is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - start
+    if duration >= settings.SLOW_QUERY_THRESHOLD:
+        log_slow_query(sql, params, many, duration, context["connection"])
+    return result
+
+
+def install_slow_query_log(sender, connection, **kwargs):
+    """
+    A `connection_created` receiver, it must be connected before the metrics one, so
+    the time spent logging isn't counted as database time of the request.
+    """
+
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
+
+def normalize(sql: str) -> str:
+    """
+    Returns the statement without its literals, placeholders and list lengths,
+    so the statements that differ only in them are grouped together.
+    """
+
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"%\(\w+\)s|%s|\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(...)", sql)
+    sql = re.sub(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+", "(...)", sql)
+    return re.sub(r"\s+", " ", sql).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+def explain(sql: str, params: Any, connection) -> str:
+    """
+    This function runs the statement again with EXPLAIN (ANALYZE, BUFFERS), bypassing the
+    execute wrappers. It runs in a savepoint inside transactions, so a failure doesn't abort them.
+
+    Args:
+        sql (str): The statement, a SELECT.
+        params (Any): Its parameters.
+        connection: The Django connection it ran on.
+
+    Returns:
+        str: The plan, or why it couldn't be captured.
+    """
+
+    in_transaction = not connection.get_autocommit()
+    with connection.connection.cursor() as cursor:
+        if in_transaction:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        except Exception as e:
+            plan = f"EXPLAIN failed: {e}"
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+        if in_transaction:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    return plan
+
+
+def log_slow_query(sql: str, params: Any, many: bool, duration: float, connection):
+    """
+    This function appends a slow statement to the log, the operation is the ninja operation
+    of the current request, if any.
+
+    Args:
+        sql (str): The statement.
+        params (Any): Its parameters.
+        many (bool): Whether it ran with executemany.
+        duration (float): How long it took in seconds.
+        connection: The Django connection it ran on.
+    """
+
+    normalized = normalize(sql)
+    metrics = current_metrics.get()
+    entry: Dict[str, Any] = {
+        "time": timezone.now().isoformat(),
+        "fingerprint": fingerprint(normalized),
+        "normalized": normalized,
+        "sql": sql,
+        # The parameters are user data, e.g. emails and message contents
+        "params": (
+            json.dumps(params, default=str)[:MAX_PARAMS_LENGTH]
+            if settings.SLOW_QUERY_PARAMS
+            else None
+        ),
+        "duration_ms": round(duration * 1000, 2),
+        "operation": metrics.operation if metrics else None,
+        "plan": None,
+    }
+    if (
+        settings.SLOW_QUERY_EXPLAIN
+        and connection.vendor == "postgresql"
+        and not many
+        and sql.lstrip().upper().startswith("SELECT")
+    ):
+        entry["plan"] = explain(sql, params, connection)
+
+    os.makedirs(os.path.dirname(settings.SLOW_QUERY_LOG), exist_ok=True)
+    with _writing, open(settings.SLOW_QUERY_LOG, "a") as f:
+        f.write(json.dumps(entry) + "\n")
@@ -2,10 +2,40 @@
 Maybe the tests are not so readable, but they get the job done for a toy project.
 """
 
-from uuid import uuid4
-
-from django.test import TestCase, Client
+from datetime import timedelta
+import base64
+import json
+import os
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlparse
+from uuid import UUID, uuid4
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, Client, override_settings
 from django.test.client import encode_multipart, BOUNDARY, MULTIPART_CONTENT
+from django.utils import timezone
+from PIL import Image
+
+from api.auth import sign_private_file, verify_private_file
+from api.benchmark import MAX_QUERIES, run_benchmark, seed_graph
+from api.helpers import apush_event
+from api.models import (
+    Friendship,
+    Message,
+    MutualFriendCount,
+    Notification,
+    PostComment,
+    PostLike,
+    friends_cache,
+)
+from api.partitions import create_partition, month_start
+from openbook.asgi import application
 
 
 VALID_PASSWORD = "12345678"
@@ -159,6 +189,39 @@ class User(TestCase):
         self.assertEqual(self.search_user(self.t1, "John").json()["count"], 1)
         self.assertEqual(self.search_user(self.t1, "Doe").json()["count"], 2)
 
+        # Email is matched by prefix only
+        self.assertEqual(self.search_user(self.t1, "janedoe").json()["count"], 1)
+        self.assertEqual(self.search_user(self.t1, "example").json()["count"], 0)
+
+        # Friends and friends of friends are ranked first
+        u3 = register_request(
+            "Jack", "Doe", "JackDoe@example.com", VALID_PASSWORD
+        ).json()["id"]
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+        t3 = login_request("JackDoe@example.com", VALID_PASSWORD).json()["token"]
+        friend_request(self.t1, self.u2["id"])
+        friend_request(t2, self.u1)
+        friend_request(t2, u3)
+        friend_request(t3, self.u2["id"])
+        self.assertEqual(
+            [u["id"] for u in self.search_user(self.t1, "Doe").json()["items"]],
+            [self.u2["id"], u3, self.u1],
+        )
+
+        # The friendship statuses are those of the authenticated user
+        friend_request(self.t1, u3)
+        self.assertEqual(
+            [
+                u["friendshipStatus"]
+                for u in self.search_user(self.t1, "Doe").json()["items"]
+            ],
+            ["friend", "requested", "stranger"],
+        )
+        self.assertEqual(
+            self.search_user(t3, "John").json()["items"][0]["friendshipStatus"],
+            "received",
+        )
+
     def test_update(self):
         self.assertEqual(self.get_user(self.t1, self.u1).json()["firstName"], "John")
 
@@ -178,6 +241,12 @@ class User(TestCase):
         self.assertEqual(d["firstName"], "Johnny")
         self.assertEqual(d["lastName"], "Doe")
 
+        # The cached principal of the token is refreshed by the update
+        friend_request(self.t1, self.u2["id"])
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+        d = client.get("/api/notification/", HTTP_AUTHORIZATION=f"Bearer {t2}").json()
+        self.assertEqual(d["items"][0]["data"]["firstName"], "Johnny")
+
 
 class TestFriendShip(TestCase):
     def setUp(self):
@@ -226,6 +295,83 @@ class TestFriendShip(TestCase):
         self.assertEqual(len(self.get_friends(self.t1).json()), 0)
         self.assertEqual(len(self.get_friends(self.t2).json()), 0)
 
+    def test_friends_cache(self):
+        friend_request(self.t1, self.u2)
+        self.assertEqual(len(self.get_friends(self.t1).json()), 0)
+
+        # The new friends are written through when the friendship commits
+        with self.captureOnCommitCallbacks(execute=True):
+            friend_request(self.t2, self.u1)
+        self.assertEqual(friends_cache.get(UUID(self.u1)), {UUID(self.u2)})
+        self.assertEqual(friends_cache.get(UUID(self.u2)), {UUID(self.u1)})
+
+    def test_friend_profiles(self):
+        friend_request(self.t1, self.u2)
+        friend_request(self.t2, self.u1)
+
+        # Only the projected fields and the id are returned
+        d = client.get(
+            "/api/friendship/profiles?cursor=&fields=firstName,friendshipStatus",
+            HTTP_AUTHORIZATION=f"Bearer {self.t1}",
+        ).json()
+        self.assertEqual(
+            d["items"],
+            [{"id": self.u2, "firstName": "Jane", "friendshipStatus": "friend"}],
+        )
+        self.assertIsNone(d["next"])
+
+        d = client.get(
+            "/api/friendship/profiles?cursor=", HTTP_AUTHORIZATION=f"Bearer {self.t2}"
+        ).json()
+        self.assertEqual(d["items"][0]["email"], VALID_EMAIL)
+        self.assertNotIn("password", d["items"][0])
+
+        # Unknown fields
+        self.assertEqual(
+            client.get(
+                "/api/friendship/profiles?fields=password",
+                HTTP_AUTHORIZATION=f"Bearer {self.t1}",
+            ).status_code,
+            422,
+        )
+
+    def test_suggestions(self):
+        u3 = register_request(
+            "Jack", "Doe", "JackDoe@example.com", VALID_PASSWORD
+        ).json()["id"]
+        t3 = login_request("JackDoe@example.com", VALID_PASSWORD).json()["token"]
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {self.t1}"}
+
+        # Jane is a mutual friend of John and Jack
+        friend_request(self.t1, self.u2)
+        friend_request(self.t2, self.u1)
+        friend_request(t3, self.u2)
+        friend_request(self.t2, u3)
+        d = client.get("/api/friendship/suggestions", **auth).json()
+        self.assertEqual([(u["id"], u["mutualFriends"]) for u in d["items"]], [(u3, 1)])
+        self.assertEqual(
+            client.get(f"/api/user/{u3}", **auth).json()["mutualFriends"], 1
+        )
+
+        # The counts match a full rebuild
+        counts = set(MutualFriendCount.objects.values_list("user", "other", "count"))
+        call_command("rebuild_mutual_friends", stdout=StringIO())
+        self.assertEqual(
+            set(MutualFriendCount.objects.values_list("user", "other", "count")),
+            counts,
+        )
+
+        # Pending friend requests aren't suggested
+        friend_request(self.t1, u3)
+        d = client.get("/api/friendship/suggestions", **auth).json()
+        self.assertEqual(d["count"], 0)
+
+        # Removing the friendship removes the mutual friend
+        client.delete(
+            f"/api/friendship/remove/{self.u2}", HTTP_AUTHORIZATION=f"Bearer {t3}"
+        )
+        self.assertFalse(MutualFriendCount.objects.exists())
+
 
 class TestMessage(TestCase):
     def setUp(self):
@@ -291,11 +437,13 @@ class TestMessage(TestCase):
 
         # Unread messages
         self.assertEqual(self.unread_messages_count(self.t2).json(), 10)
+        self.assertTrue(self.get_chats(self.t2).json()[0]["attention"])
 
         # Read messages
         self.assertEqual(self.get_messages(self.t2, self.u1).json()["count"], 10)
 
         self.assertEqual(self.unread_messages_count(self.t2).json(), 0)
+        self.assertFalse(self.get_chats(self.t2).json()[0]["attention"])
 
         # Chats
         self.send_message(self.t3, self.u1, "Hello from Alice")
@@ -317,6 +465,24 @@ class TestMessage(TestCase):
             "Hello from Alice",
         )
 
+    def test_private_file_signature(self):
+        url = urlparse(sign_private_file("private/a.png", self.u1))
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        expires, signature = int(query["expires"]), query["signature"]
+        self.assertEqual(url.path, "/private/a.png")
+
+        # The signature is bound to the file, the user and the expiration
+        for name, user, expires_at, valid in [
+            ("private/a.png", self.u1, expires, True),
+            ("private/b.png", self.u1, expires, False),
+            ("private/a.png", self.u2, expires, False),
+            ("private/a.png", self.u1, expires + 1, False),
+            ("private/a.png", self.u1, 0, False),
+        ]:
+            self.assertEqual(
+                verify_private_file(name, user, expires_at, signature), valid
+            )
+
 
 class NotificationTest(TestCase):
     def get_notifications(self, token):
@@ -357,6 +523,10 @@ class NotificationTest(TestCase):
         self.mark_notification_as_read(t2, not_id)
         self.assertEqual(self.get_unread_notifications_count(t2).json(), 0)
 
+        # Marking it again doesn't change the count
+        self.mark_notification_as_read(t2, not_id)
+        self.assertEqual(self.get_unread_notifications_count(t2).json(), 0)
+
         # Friend request accepted
         friend_request(t2, u1)
         self.check_notifications(
@@ -374,6 +544,48 @@ class NotificationTest(TestCase):
         # Post commented
         comment_post(t1, p, "Nice post")
         self.check_notifications(self.get_notifications(t2).json(), 3, "POST_COMMENTED")
+        self.assertEqual(self.get_unread_notifications_count(t2).json(), 2)
+
+        # Likes of the same post are aggregated and toggling doesn't count again
+        like_post(t1, p)
+        like_post(t1, p)
+        register_request("Alice", "Smith", "AliceSmith@example.com", VALID_PASSWORD)
+        t3 = login_request("AliceSmith@example.com", VALID_PASSWORD).json()["token"]
+        like_post(t3, p)
+        d = self.get_notifications(t2).json()
+        self.check_notifications(d, 3, "POST_LIKED")
+        self.assertEqual(d["items"][0]["data"]["actorCount"], 2)
+        self.assertEqual(d["items"][0]["data"]["firstName"], "Alice")
+        self.assertEqual(self.get_unread_notifications_count(t2).json(), 2)
+
+        # Toggling isn't counted again once more actors pushed the actor out of the latest
+        for i in range(3):
+            register_request("Bob", "Smith", f"Bob{i}@example.com", VALID_PASSWORD)
+            t = login_request(f"Bob{i}@example.com", VALID_PASSWORD).json()["token"]
+            like_post(t, p)
+        like_post(t1, p)
+        like_post(t1, p)
+        d = self.get_notifications(t2).json()["items"][0]["data"]
+        self.assertEqual(d["actorCount"], 5)
+        self.assertEqual(len(d["actors"]), 3)
+
+    def test_retention(self):
+        u1 = register_request(*VALID_CREDENTIALS).json()["id"]
+        register_request("Jane", "Doe", "JaneDoe@example.com", VALID_PASSWORD)
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+        friend_request(t1, u2)
+
+        # The notification is moved to a month past the retention
+        old = timezone.now() - timedelta(days=31 * 13)
+        Notification.objects.update(created_at=old)
+        with connection.cursor() as cursor:
+            create_partition(cursor, "api_notification", month_start(old))
+
+        with self.settings(NOTIFICATION_RETENTION_ARCHIVE=False):
+            call_command("maintain_partitions", stdout=StringIO())
+        self.assertEqual(self.get_notifications(t2).json()["count"], 0)
+        self.assertEqual(self.get_unread_notifications_count(t2).json(), 0)
 
 
 class PostTest(TestCase):
@@ -414,6 +626,8 @@ class PostTest(TestCase):
 
         # Get non existing post
         self.assertEqual(self.get_post(t1, uuid4()).status_code, 404)
+        self.assertEqual(self.comments_of_post(t1, uuid4()).status_code, 404)
+        self.assertEqual(self.get_posts_of_user(t1, uuid4()).status_code, 404)
 
         # Get post
         self.assertEqual(self.get_post(t1, p).json()["content"], "Hello")
@@ -436,9 +650,16 @@ class PostTest(TestCase):
         like_post(t2, p)
         self.assertEqual(self.get_post(t1, p).json()["likes"], 1)
 
+        # Unlike and like again
+        like_post(t2, p)
+        self.assertEqual(self.get_post(t1, p).json()["likes"], 0)
+        like_post(t2, p)
+        self.assertEqual(self.get_post(t1, p).json()["likes"], 1)
+
         # Comment post
         comment_post(t2, p, "Nice post")
         self.assertEqual(self.comments_of_post(t1, p).json()["count"], 1)
+        self.assertEqual(self.get_post(t1, p).json()["comments"], 1)
 
         comment_id = self.comments_of_post(t1, p).json()["items"][0]["id"]
         # Delete comment from wrong user
@@ -449,6 +670,7 @@ class PostTest(TestCase):
 
         # Comment count
         self.assertEqual(self.comments_of_post(t1, p).json()["count"], 0)
+        self.assertEqual(self.get_post(t1, p).json()["comments"], 0)
 
         # Delete post from wrong user
         self.assertEqual(self.delete_post(t2, p).status_code, 404)
@@ -460,12 +682,426 @@ class PostTest(TestCase):
         self.assertEqual(self.get_feed(t1).json()["count"], 0)
         self.assertEqual(self.get_feed(t2).json()["count"], 0)
 
+    def test_feed_timeline(self):
+        u1 = register_request(*VALID_CREDENTIALS).json()["id"]
+        u2 = register_request(
+            "Jane", "Doe", "JaneDoe@example.com", VALID_PASSWORD
+        ).json()["id"]
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+
+        # Posts before the friendship are backfilled
+        create_post(t1, "Hello")
+        friend_request(t1, u2)
+        friend_request(t2, u1)
+        self.assertEqual(self.get_feed(t2).json()["count"], 1)
+
+        # Posts after the friendship are fanned out
+        create_post(t1, "Hello again")
+        self.assertEqual(self.get_feed(t2).json()["count"], 2)
+
+        # Posts of former friends are pruned
+        client.delete(
+            f"/api/friendship/remove/{u1}", HTTP_AUTHORIZATION=f"Bearer {t2}"
+        )
+        self.assertEqual(self.get_feed(t2).json()["count"], 0)
+        self.assertEqual(self.get_feed(t1).json()["count"], 2)
+
+    def test_feed_cursor(self):
+        register_request(*VALID_CREDENTIALS)
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        for i in range(12):
+            create_post(t1, f"Post {i}")
 
+        # First page
+        d = client.get(
+            "/api/post/feed?cursor=", HTTP_AUTHORIZATION=f"Bearer {t1}"
+        ).json()
+        self.assertEqual(len(d["items"]), 10)
+        self.assertEqual(d["items"][0]["content"], "Post 11")
+        self.assertIsNone(d["count"])
+        self.assertIsNone(d["previous"])
+
+        # Last page
+        d = client.get(
+            f"/api/post/feed?cursor={d['next']}", HTTP_AUTHORIZATION=f"Bearer {t1}"
+        ).json()
+        self.assertEqual([p["content"] for p in d["items"]], ["Post 1", "Post 0"])
+        self.assertIsNone(d["next"])
+
+        # Back to the first page
+        d = client.get(
+            f"/api/post/feed?cursor={d['previous']}", HTTP_AUTHORIZATION=f"Bearer {t1}"
+        ).json()
+        self.assertEqual(len(d["items"]), 10)
+        self.assertIsNone(d["previous"])
+
+        # Invalid cursors
+        for cursor in [
+            "invalid",
+            base64.urlsafe_b64encode(b'["yesterday", "1", true]').decode(),
+            base64.urlsafe_b64encode(b'["2024-01-01T00:00:00", 1, true]').decode(),
+        ]:
+            self.assertEqual(
+                client.get(
+                    f"/api/post/feed?cursor={cursor}", HTTP_AUTHORIZATION=f"Bearer {t1}"
+                ).status_code,
+                400,
+            )
+
+    def test_feed_pulled_and_trimmed(self):
+        u1 = register_request(*VALID_CREDENTIALS).json()["id"]
+        u2 = register_request(
+            "Jane", "Doe", "JaneDoe@example.com", VALID_PASSWORD
+        ).json()["id"]
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+        friend_request(t1, u2)
+        friend_request(t2, u1)
+
+        # Posts of authors with too many friends are pulled
+        with self.settings(FEED_FANOUT_LIMIT=0):
+            for i in range(12):
+                create_post(t1, f"Post {i}")
+        d = client.get(
+            "/api/post/feed?cursor=", HTTP_AUTHORIZATION=f"Bearer {t2}"
+        ).json()
+        self.assertEqual(d["items"][0]["content"], "Post 11")
+        d = client.get(
+            f"/api/post/feed?cursor={d['next']}", HTTP_AUTHORIZATION=f"Bearer {t2}"
+        ).json()
+        self.assertEqual([p["content"] for p in d["items"]], ["Post 1", "Post 0"])
+
+        # Timelines keep the latest posts
+        with self.settings(FEED_TIMELINE_SIZE=5, FEED_TIMELINE_TRIM_EVERY=1):
+            create_post(t1, "Post 12")
+        d = client.get(
+            "/api/post/feed?cursor=", HTTP_AUTHORIZATION=f"Bearer {t1}"
+        ).json()
+        self.assertEqual(len(d["items"]), 5)
+        self.assertIsNone(d["next"])
+
+    def test_media_variants(self):
+        register_request(*VALID_CREDENTIALS)
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        image = BytesIO()
+        Image.new("RGB", (1000, 500)).save(image, "PNG")
+
+        with TemporaryDirectory() as media_root, self.settings(
+            MEDIA_ROOT=media_root, MEDIA_PROCESS_WORKERS=0
+        ), self.captureOnCommitCallbacks(execute=True):
+            id = client.post(
+                "/api/post",
+                {"files": [SimpleUploadedFile("a.png", image.getvalue(), "image/png")]},
+                HTTP_AUTHORIZATION=f"Bearer {t1}",
+            ).json()["id"]
+
+        # Only the widths smaller than the image are generated
+        variants = self.get_post(t1, id).json()["fileVariants"][0]
+        self.assertEqual(set(variants), {"thumbnail", "small"})
+        self.assertEqual(variants["small"]["height"], 240)
+
+    def test_chunked_upload(self):
+        register_request(*VALID_CREDENTIALS)
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {t1}"}
+        image = BytesIO()
+        Image.new("RGB", (100, 100)).save(image, "PNG")
+        data = image.getvalue()
+
+        with TemporaryDirectory() as media_root, self.settings(
+            MEDIA_ROOT=media_root, UPLOAD_ROOT=media_root, MEDIA_PROCESS_WORKERS=0
+        ):
+            id = client.post(
+                "/api/upload",
+                {"contentType": "image/png", "size": len(data)},
+                "application/json",
+                **auth,
+            ).json()["id"]
+
+            def append(offset, chunk):
+                return client.put(
+                    f"/api/upload/{id}?offset={offset}",
+                    chunk,
+                    "application/octet-stream",
+                    **auth,
+                )
+
+            # Chunks are appended in order and resumed from the received bytes
+            self.assertEqual(append(0, data[:20]).json()["received"], 20)
+            self.assertEqual(append(10, data[20:]).status_code, 409)
+            self.assertEqual(
+                client.post(f"/api/upload/{id}/complete", **auth).status_code, 409
+            )
+            self.assertEqual(append(20, data[20:]).json()["received"], len(data))
+            self.assertEqual(
+                client.post(f"/api/upload/{id}/complete", **auth).status_code, 200
+            )
+
+            # The upload is taken in place of a file only once
+            d = client.post("/api/post", {"uploads": [id]}, **auth)
+            self.assertEqual(d.status_code, 201)
+            self.assertEqual(
+                self.get_post(t1, d.json()["id"]).json()["files"][0][-4:], ".png"
+            )
+            self.assertEqual(
+                client.post("/api/post", {"uploads": [id]}, **auth).status_code, 404
+            )
+
+            # The type is checked by the content of the file
+            id = client.post(
+                "/api/upload",
+                {"contentType": "video/mp4", "size": len(data)},
+                "application/json",
+                **auth,
+            ).json()["id"]
+            self.assertEqual(append(0, data).status_code, 415)
+
+
+class QueryPlanTest(TestCase):
+    """
+    The hot queries must be answered from an index, whichever one the planner picks.
+    Sequential scans are disabled, as the planner rightly prefers them for the few rows
+    of the tests, so a plan still has one only if no index can answer the query.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+
+    def assertNoSeqScan(self, queryset):
+        def walk(node):
+            if node["Node Type"] == "Seq Scan":
+                yield node["Relation Name"]
+            for child in node.get("Plans", []):
+                yield from walk(child)
+
+        plan = json.loads(queryset.explain(format="json"))
+        self.assertEqual(list(walk(plan[0]["Plan"])), [], queryset.query)
+
+    def test_message_plans(self):
+        u1, u2 = uuid4(), uuid4()
+        self.assertNoSeqScan(
+            Message.objects.filter(
+                Q(sender_id=u1, recipient_id=u2) | Q(sender_id=u2, recipient_id=u1)
+            ).order_by("-sent_at")
+        )
+        self.assertNoSeqScan(
+            Message.objects.filter(recipient_id=u1, sender_id=u2, read=False)
+        )
+
+    def test_notification_plans(self):
+        u1 = uuid4()
+        self.assertNoSeqScan(
+            Notification.objects.filter(recipient_id=u1).order_by("-created_at")
+        )
+        self.assertNoSeqScan(
+            Notification.objects.filter(
+                recipient_id=u1,
+                type=Notification.Types.POST_LIKED,
+                read=False,
+                created_at__gte=timezone.now() - timedelta(days=1),
+                data__postId=str(uuid4()),
+            ).order_by("-created_at")
+        )
+
+    def test_friendship_plans(self):
+        u1, u2 = uuid4(), uuid4()
+        self.assertNoSeqScan(
+            Friendship.objects.filter(
+                Q(requested_by=u1, accepted_by=u2) | Q(requested_by=u2, accepted_by=u1),
+                accepted_at__isnull=False,
+            )
+        )
+        self.assertNoSeqScan(
+            Friendship.objects.filter(accepted_by=u1, accepted_at__isnull=False)
+        )
+
+    def test_post_plans(self):
+        p, u1 = uuid4(), uuid4()
+        self.assertNoSeqScan(PostLike.objects.filter(post_id=p, liked_by_id=u1))
+        self.assertNoSeqScan(
+            PostComment.objects.filter(post_id=p).order_by("-commented_at")
+        )
+
+
+class QueryCountTest(TestCase):
+    """
+    Every endpoint must run the same number of queries on a small and a larger graph.
+    Run `manage.py bench_queries` for the timings.
+    """
+
+    def test_query_counts(self):
+        small = run_benchmark(seed_graph(friends=2, posts=2, prefix="small"), client)
+        large = run_benchmark(seed_graph(friends=12, posts=6, prefix="large"), client)
+
+        for name, stats in large.items():
+            with self.subTest(name):
+                self.assertLess(stats["status"], 400)
+                self.assertLessEqual(stats["queries"], small[name]["queries"])
+                self.assertLessEqual(stats["queries"], MAX_QUERIES)
+
+
+class MetricsTest(TestCase):
+    def test_metrics(self):
+        register_request(*VALID_CREDENTIALS)
+        token = login_request(*VALID_LOGIN).json()["token"]
+
+        with TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            d = client.get(
+                "/api/notification/count", HTTP_AUTHORIZATION=f"Bearer {token}"
+            )
+            self.assertRegex(d["Server-Timing"], r'db;dur=[\d.]+;desc="\d+ queries"')
+            self.assertIn("total;dur=", d["Server-Timing"])
+
+            # The histograms live as long as the worker, other tests add to them too
+            d = client.get("/metrics").content.decode()
+            self.assertRegex(
+                d,
+                r'openbook_request_queries_count\{operation="'
+                r'api_views_notification_get_unread_notifications_count"\} [1-9]',
+            )
+            self.assertRegex(
+                d,
+                r'openbook_requests_total\{operation="api_views_user_login",'
+                r'status="200"\} [1-9]',
+            )
+
+            # The files of the workers that exited are removed, no pid is above 2 ** 22
+            dead = os.path.join(directory, f"{2 ** 22 + 1}.json")
+            with open(dead, "w") as f:
+                json.dump({"openbook_requests_total": {'operation="dead"': 1}}, f)
+            self.assertNotIn('operation="dead"', client.get("/metrics").content.decode())
+            self.assertFalse(os.path.exists(dead))
+
+
+class ProfileTest(TestCase):
+    def test_profile(self):
+        register_request(*VALID_CREDENTIALS)
+        token = login_request(*VALID_LOGIN).json()["token"]
+        auth = {"HTTP_AUTHORIZATION": f"Bearer {token}"}
+
+        with TemporaryDirectory() as directory, self.settings(
+            PROFILE_DIR=directory, PROFILE_SECRET="secret", PROFILE_KEEP=2
+        ):
+            # Only the requests with the secret are profiled
+            d = client.get("/api/user/me", **auth)
+            self.assertFalse(d.has_header("X-Profile"))
+            for _ in range(3):
+                d = client.get("/api/user/me", HTTP_X_PROFILE="secret", **auth)
+            self.assertTrue(d["X-Profile"].startswith("api_views_user_me/"))
+            self.assertEqual(len(os.listdir(f"{directory}/api_views_user_me")), 2)
+
+            # Every operation keeps its own newest profiles
+            for _ in range(3):
+                d = client.get("/api/friendship", HTTP_X_PROFILE="secret", **auth)
+            friends = d["X-Profile"].split("/")[0]
+            self.assertNotEqual(friends, "api_views_user_me")
+            self.assertEqual(len(os.listdir(f"{directory}/{friends}")), 2)
+            self.assertEqual(len(os.listdir(f"{directory}/api_views_user_me")), 2)
+
+            d = client.get(
+                "/api/profile/summary?operation=api_views_user_me",
+                HTTP_X_PROFILE="secret",
+                **auth,
+            )
+            self.assertEqual(d.json()["samples"], 2)
+            self.assertTrue(d.json()["functions"])
+            d = client.get("/api/profile/summary", HTTP_X_PROFILE="wrong", **auth)
+            self.assertEqual(d.status_code, 403)
+
+            # Only the known operations, they name the directories of the profiles
+            d = client.get(
+                "/api/profile/summary?operation=..", HTTP_X_PROFILE="secret", **auth
+            )
+            self.assertEqual(d.status_code, 404)
+
+            # Async operations are profiled too
+            d = client.get("/api/notification/count", HTTP_X_PROFILE="secret", **auth)
+            self.assertTrue(d["X-Profile"].startswith("api_views_notification_"))
+
+
+class SlowQueryTest(TestCase):
+    def test_slow_query_log(self):
+        register_request(*VALID_CREDENTIALS)
+        auth = {
+            "HTTP_AUTHORIZATION": f"Bearer {login_request(*VALID_LOGIN).json()['token']}"
+        }
+
+        with TemporaryDirectory() as directory, self.settings(
+            SLOW_QUERY_THRESHOLD=0,
+            SLOW_QUERY_EXPLAIN=True,
+            SLOW_QUERY_PARAMS=False,
+            SLOW_QUERY_LOG=f"{directory}/slow_queries.jsonl",
+        ):
+            self.assertEqual(client.get("/api/user/me", **auth).status_code, 200)
+            with open(f"{directory}/slow_queries.jsonl") as f:
+                entries = [json.loads(line) for line in f]
+
+            select = next(
+                e
+                for e in entries
+                if e["operation"] == "api_views_user_me" and e["sql"].startswith("SELECT")
+            )
+            self.assertIn("actual time", select["plan"])
+            self.assertNotIn("%s", select["normalized"])
+            self.assertIsNone(select["params"])
+
+            # The transaction of the test is still usable after the EXPLAINs
+            self.assertEqual(client.get("/api/user/me", **auth).status_code, 200)
+
+            out = StringIO()
+            call_command("slow_queries", "--plans", stdout=out)
+            self.assertIn(select["fingerprint"], out.getvalue())
+            self.assertIn("api_views_user_me", out.getvalue())
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
 class TestRealTime(TestCase):
     """
-    Well, testing of sockets that need authentication is in django-channels
-    is a nightmare. Seriously I couldn't get it to work. I wasted a lot of time.
-    https://github.com/django/channels/issues/903
+    The sockets are driven through `async_to_sync`, so the queries of the consumer
+    run on the test thread and see the users of the test transaction.
     """
 
-    pass
+    async def open_socket(self, token):
+        socket = WebsocketCommunicator(application, "/ws")
+        connected, _ = await socket.connect()
+        self.assertTrue(connected)
+        await socket.send_json_to({"token": token})
+        return socket
+
+    def test_push(self):
+        u1 = register_request(*VALID_CREDENTIALS).json()["id"]
+        register_request("Jane", "Doe", "JaneDoe@example.com", VALID_PASSWORD)
+        t1 = login_request(*VALID_LOGIN).json()["token"]
+        t2 = login_request("JaneDoe@example.com", VALID_PASSWORD).json()["token"]
+
+        async def sockets():
+            # A socket with an invalid token is closed
+            socket = await self.open_socket("invalid")
+            self.assertEqual(
+                await socket.receive_json_from(), {"error": "Invalid token"}
+            )
+            self.assertEqual(
+                (await socket.receive_output())["type"], "websocket.close"
+            )
+
+            # Every socket of the user gets the pushes of the user, and only them
+            tab, phone = await self.open_socket(t1), await self.open_socket(t1)
+            other = await self.open_socket(t2)
+            for socket in (tab, phone, other):
+                self.assertTrue(await socket.receive_nothing(timeout=0.5))
+
+            await apush_event([UUID(u1)], "NEW_MESSAGE", {"content": "Hi"})
+            for socket in (tab, phone):
+                event = await socket.receive_json_from()
+                self.assertEqual(event["event"], "NEW_MESSAGE")
+                self.assertEqual(event["data"], {"content": "Hi"})
+            self.assertTrue(await other.receive_nothing())
+
+            for socket in (tab, phone, other):
+                await socket.disconnect()
+
+        async_to_sync(sockets)()
@@ -0,0 +1,108 @@
+"""
+The chunked uploads, they are appended to a file in `UPLOAD_ROOT` and then
+handed to the views that take files in place of a multipart file.
+"""
+
+from typing import List
+import os
+
+from django.core.files.uploadedfile import UploadedFile
+from pydantic import UUID4
+
+from api.models import Upload, User
+
+
+# The bytes needed to recognize every signature below
+SNIFF_SIZE = 16
+
+
+def sniff_content_type(head: bytes) -> str | None:
+    """
+    This function recognizes the images and videos the clients can upload by their first bytes,
+    so the declared content type of an upload isn't trusted.
+
+    Args:
+        head (bytes): The first `SNIFF_SIZE` bytes of the file.
+
+    Returns:
+        str | None: The content type or None if the file isn't recognized.
+    """
+
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith(b"RIFF") and head[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if head.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm"
+    if head[4:8] == b"ftyp":
+        return "video/quicktime" if head[8:10] == b"qt" else "video/mp4"
+    return None
+
+
+class ChunkedUploadFile(UploadedFile):
+    """
+    A completed upload as an uploaded file, the file system storage moves it instead of copying it.
+    """
+
+    def __init__(self, upload: Upload):
+        super().__init__(
+            open(upload.path, "rb"),
+            f"{upload.id.hex}.{upload.content_type.split('/')[1]}",
+            upload.content_type,
+            upload.size,
+        )
+        self.upload = upload
+
+    def temporary_file_path(self) -> str:
+        return self.upload.path
+
+
+def open_uploads(
+    user: User, upload_ids: List[UUID4]
+) -> List[ChunkedUploadFile] | None:
+    """
+    This function opens the completed uploads of the user.
+
+    Args:
+        user (User): The user that uploaded the files.
+        upload_ids (List[UUID4]): The ids of the uploads.
+
+    Returns:
+        List[ChunkedUploadFile] | None: The uploads or None if any of them isn't found.
+    """
+
+    uploads = list(Upload.objects.filter(id__in=upload_ids, user=user, completed=True))
+    if len(uploads) != len(set(upload_ids)):
+        return None
+
+    return [ChunkedUploadFile(upload) for upload in uploads]
+
+
+def release_uploads(files: List[ChunkedUploadFile]):
+    """
+    This function deletes the uploads once the files are saved, the files
+    that weren't saved (e.g. of an unwanted type) are deleted too.
+
+    Args:
+        files (List[ChunkedUploadFile]): The opened uploads.
+    """
+
+    for file in files:
+        file.close()
+        delete_upload(file.upload)
+
+
+def delete_upload(upload: Upload):
+    """
+    Deletes the upload and its file if it's still there.
+    """
+
+    if os.path.exists(upload.path):
+        os.remove(upload.path)
+    upload.delete()
@@ -1,14 +1,31 @@
 from typing import List
 
+from django.db import transaction
 from django.utils import timezone
 from pydantic import UUID4
 from ninja import Router, Path
-from django.db.models import Q
+from ninja.errors import HttpError
+from ninja.pagination import paginate
+from django.db.models import Case, F, OuterRef, Q, Subquery, Value, When
 
-from api.schemas import UserOutMulti
+from api.pagination import CursorPagination, keyset
+from api.schemas import UserOutPartial, UserSuggestionOut
 from api.models import Notification, User, Friendship
-from api.helpers import create_notification
-
+from api.helpers import (
+    create_notification,
+    backfill_timelines,
+    prune_timelines,
+    snake_case_to_camel_case,
+    update_mutual_friends,
+)
+
+
+# The fields a friend's profile can be projected to, by their name in the responses
+PROFILE_FIELDS = {
+    snake_case_to_camel_case(field.name): field.name
+    for field in User._meta.concrete_fields
+    if field.name != "password"
+}
 
 router = Router(tags=["friendship"])
 
@@ -60,8 +77,19 @@ def add_friend(request, id: UUID4):
         return 403, "Friend request already sent"
 
     if friendship_entity.accepted_by == request_user:
-        friendship_entity.accepted_at = timezone.now()
-        friendship_entity.save()
+        # Only the request that accepts it counts the friendship
+        with transaction.atomic():
+            accepted = Friendship.objects.filter(
+                id=friendship_entity.id, accepted_at__isnull=True
+            ).update(accepted_at=timezone.now())
+            if accepted:
+                friend_id = friendship_entity.requested_by_id
+                User.refresh_friends(request_user.id, friend_id)
+                update_mutual_friends(request_user.id, friend_id, 1)
+                backfill_timelines(request_user.id, friend_id)
+        if not accepted:
+            return 409, "Already friends"
+
         create_notification(
             friendship_entity.requested_by_id,
             Notification.Types.FRIEND_REQUEST_ACCEPTED,
@@ -99,10 +127,84 @@ def remove_friend(request, id: UUID4):
     if not friendship_entity:
         return 404, "Friendship not found"
 
-    friendship_entity.delete()
+    # Only the request that deletes it uncounts the friendship, as it was when deleted
+    with transaction.atomic():
+        friendship_entity = (
+            Friendship.objects.select_for_update().filter(id=friendship_entity.id).first()
+        )
+        deleted = friendship_entity.delete()[0] if friendship_entity else 0
+        if deleted and friendship_entity.accepted_at:
+            User.refresh_friends(first_user.id, second_user.id)
+            update_mutual_friends(first_user.id, second_user.id, -1)
+            prune_timelines(first_user.id, second_user.id)
+    if not deleted:
+        return 404, "Friendship not found"
+
     return 200, "Friendship removed"
 
 
 @router.get("", response=List[UUID4])
 def friends(request):
-    return request.auth.friends()
+    return list(request.auth.friends())
+
+
+@router.get("/profiles", response=List[UserOutPartial], exclude_unset=True)
+@paginate(CursorPagination, ordering_field="friends_since", pass_parameter="page_input")
+def friend_profiles(request, fields: str = None, **kwargs):
+    """
+    The profiles of the friends from the newest friendship to the oldest, one query per page.
+    `fields` is a comma separated list of the fields to return,
+    e.g. `firstName,lastName,profileImage`, the id is always returned.
+    Without it all the fields and `friendshipStatus` are returned.
+    """
+
+    fields = fields.split(",") if fields else [*PROFILE_FIELDS, "friendshipStatus"]
+    if unknown := set(fields) - {*PROFILE_FIELDS, "friendshipStatus"}:
+        raise HttpError(422, f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    # The page is found on the friendships of the user and only its friends are loaded
+    friendships = Friendship.objects.filter(
+        Q(requested_by=request.auth) | Q(accepted_by=request.auth),
+        accepted_at__isnull=False,
+    ).annotate(
+        friend_id=Case(
+            When(requested_by=request.auth, then=F("accepted_by")),
+            default=F("requested_by"),
+        )
+    )
+    if (cursor := kwargs["page_input"].cursor) is not None:
+        friendships, _ = keyset(friendships, cursor, "accepted_at", id_field="friend_id")
+
+    friends_since = Friendship.objects.filter(
+        Q(requested_by=request.auth, accepted_by=OuterRef("id"))
+        | Q(requested_by=OuterRef("id"), accepted_by=request.auth),
+        accepted_at__isnull=False,
+    ).values("accepted_at")[:1]
+    friends = (
+        User.objects.filter(id__in=friendships.values("friend_id"))
+        .only("id", *(PROFILE_FIELDS[f] for f in fields if f in PROFILE_FIELDS))
+        .annotate(friends_since=Subquery(friends_since))
+    )
+    if "friendshipStatus" in fields:
+        friends = friends.annotate(friendship_status=Value("friend"))
+
+    return friends.order_by("-friends_since", "-id")
+
+
+@router.get("/suggestions", response=List[UserSuggestionOut])
+@paginate
+def suggestions(request):
+    """
+    People you may know, ranked by their mutual friends with the user.
+    The friends and the users with a pending friend request either way are left out.
+    """
+
+    pending = Friendship.objects.filter(accepted_at__isnull=True)
+    return (
+        User.objects.filter(mutual_friend_counts__user=request.auth)
+        .exclude(id__in=request.auth.friends())
+        .exclude(id__in=pending.filter(requested_by=request.auth).values("accepted_by"))
+        .exclude(id__in=pending.filter(accepted_by=request.auth).values("requested_by"))
+        .annotate(mutual_friends=F("mutual_friend_counts__count"))
+        .order_by("-mutual_friends", "id")
+    )
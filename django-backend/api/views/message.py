@@ -1,118 +1,111 @@
 from typing import List
 
+from asgiref.sync import sync_to_async
 from ninja import Router, Form, File, UploadedFile
 from ninja.pagination import paginate
-from django.db import connection
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.db.models.lookups import GreaterThan
 from pydantic import UUID4
 
-from api.helpers import create_message, dict_fetchall
-from api.models import Friendship, Message
+from api.pagination import CursorPagination
+from api.helpers import acreate_message, add_unread
+from api.models import Friendship, Message, Conversation, UnreadCounter, User
 from api.schemas import MessageIn, MessageOut, ChatOut
+from api.uploads import open_uploads, release_uploads
 
 
 router = Router(tags=["message"])
 
 
-@router.post("", response={201: str, 400: str, 403: str})
-def send_message(request, data: Form[MessageIn], file: File[UploadedFile] = None):
-    friendship = Friendship.objects.filter(
+@router.post("", response={201: str, 400: str, 403: str, 404: str})
+async def send_message(
+    request, data: Form[MessageIn], file: File[UploadedFile] = None
+):
+    friendship = await Friendship.objects.filter(
         (Q(requested_by=request.auth, accepted_by=data.recipient_id))
         | (Q(requested_by=data.recipient_id, accepted_by=request.auth)),
         accepted_at__isnull=False,
-    ).first()
+    ).aexists()
 
     if not friendship:
         return 403, "Friendship not found"
 
-    if not data.content and not file:
+    if not data.content and not file and not data.upload:
         return 400, "No content provided"
 
-    create_message(request.auth.id, data.recipient_id, data.content, file)
+    uploads = await sync_to_async(open_uploads)(
+        request.auth, [data.upload] if data.upload else []
+    )
+    if uploads is None:
+        return 404, "Upload not found"
+
+    await acreate_message(
+        request.auth.id,
+        data.recipient_id,
+        data.content,
+        file or (uploads[0] if uploads else None),
+    )
+    await sync_to_async(release_uploads)(uploads)
     return 201, "Message sent"
 
 
 @router.get("/unread", response=int)
-def unread_messages_count(request):
-    return Message.objects.filter(recipient_id=request.auth, read=False).count()
+async def unread_messages_count(request):
+    """
+    The count is also pushed with every `NEW_MESSAGE` event.
+    """
+
+    return (
+        await UnreadCounter.objects.filter(user=request.auth)
+        .values_list("messages", flat=True)
+        .afirst()
+        or 0
+    )
 
 
 @router.get("/chats", response=List[ChatOut])
-def chats(request):
-    with connection.cursor() as cursor:
-        cursor.execute(
-            """
-                WITH
-                    "chat_table" AS (
-                        SELECT
-                            "recipient_id" AS "friend_id",
-                            "sent_at",
-                            CONCAT (
-                                'You: ', 
-                                CASE 
-                                    WHEN "content" = ''
-                                        THEN '📎 Attachment'
-                                    ELSE 
-                                        "content"
-                                END
-                            ) as "content",
-                            false as "attention"
-                        FROM
-                            "api_message"
-                        WHERE
-                            "sender_id" = %(id)s
-                        UNION
-                        SELECT
-                            "sender_id" AS "friend_id",
-                            "sent_at",
-                            CASE 
-                                WHEN "content" = '' 
-                                    THEN '📎 Attachment'
-                                ELSE
-                                    "content" 
-                            END as "content",
-                            NOT "read" as "attention"
-                        FROM
-                            "api_message"
-                        WHERE
-                            "recipient_id" = %(id)s
-                    )
-                SELECT
-                    "friend_id",
-                    "first_name",
-                    "last_name",
-                    "profile_image",
-                    "last_active",
-                    "sent_at",
-                    "content",
-                    "attention"
-                FROM
-                    "chat_table" INNER JOIN "api_user" ON "chat_table"."friend_id" = "api_user"."id"
-                WHERE
-                    ("friend_id", "sent_at") IN (
-                        SELECT
-                            "friend_id",
-                            MAX("sent_at")
-                        FROM
-                            "chat_table"
-                        GROUP BY
-                            "friend_id"
-                    )
-                ORDER BY "sent_at" DESC 
-            """,
-            {"id": request.auth.id},
+async def chats(request):
+    conversations = (
+        Conversation.objects.filter(user=request.auth)
+        .order_by("-last_message_at")
+        .values(
+            "friend_id",
+            first_name=F("friend__first_name"),
+            last_name=F("friend__last_name"),
+            profile_image=F("friend__profile_image"),
+            last_active=F("friend__last_active"),
+            sent_at=F("last_message_at"),
+            content=F("last_message"),
+            attention=GreaterThan(F("unread_count"), 0),
         )
-
-        return dict_fetchall(cursor)
+    )
+    return [c async for c in conversations]
+
+
+@sync_to_async
+@transaction.atomic
+def read_messages(user: User, friend_id: UUID4):
+    """
+    Marks the messages of the friend to the user as read and uncounts them
+    from the conversation and the unread messages of the user.
+    """
+
+    read = Message.objects.filter(
+        recipient_id=user, sender_id=friend_id, read=False
+    ).update(read=True)
+    if read:
+        Conversation.objects.filter(user=user, friend_id=friend_id).update(
+            unread_count=Greatest(F("unread_count") - read, 0)
+        )
+        add_unread([user.id], messages=-read)
 
 
 @router.get("/{id}", response=List[MessageOut])
-@paginate
-def get_messages(request, id: UUID4):
-    Message.objects.filter(recipient_id=request.auth, sender_id=id, read=False).update(
-        read=True
-    )
-
+@paginate(CursorPagination, ordering_field="sent_at")
+async def get_messages(request, id: UUID4):
+    await read_messages(request.auth, id)
     return Message.objects.filter(
         Q(sender_id=request.auth, recipient_id=id)
         | Q(sender_id=id, recipient_id=request.auth)
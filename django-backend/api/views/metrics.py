@@ -0,0 +1,11 @@
+from django.http import HttpResponse
+
+from api.metrics import store
+
+
+def metrics(request):
+    """
+    The request histograms of all the workers in the Prometheus text format.
+    """
+
+    return HttpResponse(store.render(), content_type="text/plain; version=0.0.4")
@@ -1,31 +1,57 @@
 from typing import List
 
+from asgiref.sync import sync_to_async
 from ninja import Router
+from django.db import transaction
 from ninja.pagination import paginate
 
+from api.pagination import CursorPagination
 from api.schemas import NotificationOut
-from api.models import Notification
+from api.helpers import add_unread
+from api.models import Notification, UnreadCounter, User
 
 
 router = Router(tags=["notification"])
 
 
 @router.get("/", response=List[NotificationOut])
-@paginate
-def get_notifications(request):
+@paginate(CursorPagination, ordering_field="created_at")
+async def get_notifications(request):
     return Notification.objects.filter(recipient=request.auth).order_by("-created_at")
 
 
 @router.get("/count", response=int)
-def get_unread_notifications_count(request):
-    return Notification.objects.filter(recipient=request.auth, read=False).count()
+async def get_unread_notifications_count(request):
+    """
+    The count is also pushed with every `NEW_NOTIFICATION` event.
+    """
+
+    return (
+        await UnreadCounter.objects.filter(user=request.auth)
+        .values_list("notifications", flat=True)
+        .afirst()
+        or 0
+    )
+
+
+@sync_to_async
+@transaction.atomic
+def read_notification(user: User, id: str) -> bool:
+    """
+    Marks the notification as read and uncounts it from the unread notifications
+    of the user, unless it was read already. Returns whether the notification exists.
+    """
+
+    read = Notification.objects.filter(id=id, recipient=user, read=False).update(
+        read=True
+    )
+    if read:
+        add_unread([user.id], notifications=-read)
+        return True
+    return Notification.objects.filter(id=id, recipient=user).exists()
 
 
 @router.patch("/read/{id}", response={200: None, 404: str})
-def mark_notification_as_read(request, id: str):
-    notification = Notification.objects.filter(id=id, recipient=request.auth).first()
-    if not notification:
+async def mark_notification_as_read(request, id: str):
+    if not await read_notification(request.auth, id):
         return 404, "Notification not found"
-
-    notification.read = True
-    notification.save()
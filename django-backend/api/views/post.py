@@ -1,109 +1,207 @@
 from typing import List
 
+from asgiref.sync import sync_to_async
 from ninja import Router, Form, File, UploadedFile
+from ninja.errors import HttpError
 from ninja.pagination import paginate
-from django.db.models import Q
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from pydantic import UUID4
 
-from api.models import User, Post, PostFile, Notification, PostLike, PostComment
+from api.pagination import CursorPagination, keyset
+from api.models import (
+    User,
+    Post,
+    PostFile,
+    Notification,
+    PostLike,
+    PostComment,
+    TimelineEntry,
+)
 from api.schemas import PostIn, PostOutMinimal, PostOut, CommentOutMinimal, CommentOut
-from api.helpers import save_file, create_notification
+from api.helpers import (
+    save_file,
+    acreate_aggregated_notification,
+    create_notifications,
+    fan_out_post,
+)
+from api.uploads import open_uploads, release_uploads
 
 
 router = Router(tags=["post"])
 
 
-@router.post("", response={201: PostOutMinimal, 422: str})
+@router.post("", response={201: PostOutMinimal, 404: str, 422: str})
 def create_post(request, data: Form[PostIn], files: File[list[UploadedFile]] = []):
-    if not data.content and not files:
+    """
+    Large files can be uploaded in chunks with the upload endpoints and sent as `uploads`.
+    """
+
+    if not data.content and not files and not data.uploads:
         return 422, "Data not provided"
 
-    post = Post.objects.create(author=request.auth, content=data.content)
+    if (uploads := open_uploads(request.auth, data.uploads)) is None:
+        return 404, "Upload not found"
+
+    friend_ids = request.auth.friends()
+    post = Post.objects.create(
+        author=request.auth,
+        content=data.content,
+        fanned_out=len(friend_ids) <= settings.FEED_FANOUT_LIMIT,
+    )
+    fan_out_post(post, [request.auth.id, *(friend_ids if post.fanned_out else [])])
+    files = [*files, *uploads]
     post_files = PostFile.objects.bulk_create([PostFile(post=post) for _ in files])
 
     for pf, file in zip(post_files, files):
         save_file(pf.file, file, ["image", "video"])
+    release_uploads(uploads)
 
-    for friend_id in request.auth.friends():
-        create_notification(
-            friend_id,
-            Notification.Types.FRIEND_POSTED,
-            {
-                "postId": str(post.id),
-                "userId": str(request.auth.id),
-                "firstName": request.auth.first_name,
-                "lastName": request.auth.last_name,
-                "profileImage": (
-                    request.auth.profile_image.url
-                    if request.auth.profile_image
-                    else None
-                ),
-            },
-        )
+    create_notifications(
+        friend_ids,
+        Notification.Types.FRIEND_POSTED,
+        {
+            "postId": str(post.id),
+            "userId": str(request.auth.id),
+            "firstName": request.auth.first_name,
+            "lastName": request.auth.last_name,
+            "profileImage": (
+                request.auth.profile_image.url if request.auth.profile_image else None
+            ),
+        },
+    )
 
     return 201, post
 
 
 @router.get("/feed", response={200: List[PostOut]})
-@paginate
-def get_feed(request):
-    return Post.include_extra(
-        Post.objects.filter(
-            Q(author__id__in=request.auth.friends()) | Q(author=request.auth)
-        ),
-        request.auth,
-    ).order_by("-posted_at")
+@paginate(CursorPagination, ordering_field="posted_at", pass_parameter="page_input")
+async def get_feed(request, **kwargs):
+    """
+    The feed is read from the user's timeline, posts of friends
+    that weren't fanned out are pulled from their authors.
+    """
+
+    timeline = TimelineEntry.objects.filter(user=request.auth)
+    pulled = Post.objects.filter(
+        author__id__in=await request.auth.afriends(), fanned_out=False
+    )
+
+    cursor = kwargs["page_input"].cursor
+    if cursor is None:
+        posts = Post.objects.filter(
+            Q(id__in=timeline.values("post_id")) | Q(id__in=pulled.values("id"))
+        )
+    else:
+        # Both are paginated on their own index and only the posts of the page are loaded
+        entries, _ = keyset(timeline, cursor, "posted_at", id_field="post_id")
+        pulled, _ = keyset(pulled, cursor, "posted_at")
+        posts = Post.objects.filter(
+            id__in=[id async for id in entries.values_list("post_id", flat=True)]
+            + [id async for id in pulled.values_list("id", flat=True)]
+        )
+
+    return Post.include_extra(posts, request.auth).order_by("-posted_at")
+
+
+@sync_to_async
+@transaction.atomic
+def toggle_like(post: Post, user: User) -> bool:
+    """
+    Likes or unlikes the post and updates its like counter.
+    Returns whether the post is liked afterwards.
+    """
+
+    unliked, _ = PostLike.objects.filter(post=post, liked_by=user).delete()
+    if unliked:
+        Post.objects.filter(id=post.id).update(like_count=F("like_count") - unliked)
+        return False
+
+    try:
+        with transaction.atomic():
+            PostLike.objects.create(post=post, liked_by=user)
+    except IntegrityError:
+        return True  # A concurrent request liked it and counted it
+    Post.objects.filter(id=post.id).update(like_count=F("like_count") + 1)
+    return True
 
 
 @router.post("/like/{id}", response={404: str, 201: str, 200: str})
-def like_post(request, id: UUID4):
-    post = Post.objects.filter(id=id).first()
+async def like_post(request, id: UUID4):
+    post = await Post.objects.filter(id=id).afirst()
     if not post:
         return 404, "Post not found"
 
-    post_liked = PostLike.objects.filter(post=post, liked_by=request.auth)
-    if post_liked:
-        post_liked.delete()
+    if not await toggle_like(post, request.auth):
         return 200, "Post unliked"
-    else:
-        PostLike.objects.create(post=post, liked_by=request.auth)
-        create_notification(
-            post.author.id,
-            Notification.Types.POST_LIKED,
-            {
-                "postId": str(post.id),
-                "userId": str(request.auth.id),
-                "firstName": request.auth.first_name,
-                "lastName": request.auth.last_name,
-                "profileImage": (
-                    request.auth.profile_image.url
-                    if request.auth.profile_image
-                    else None
-                ),
-            },
-        )
-        return 201, "Post liked"
+
+    await acreate_aggregated_notification(
+        post.author_id,
+        Notification.Types.POST_LIKED,
+        {
+            "postId": str(post.id),
+            "userId": str(request.auth.id),
+            "firstName": request.auth.first_name,
+            "lastName": request.auth.last_name,
+            "profileImage": (
+                request.auth.profile_image.url if request.auth.profile_image else None
+            ),
+        },
+    )
+    return 201, "Post liked"
+
+
+@sync_to_async
+@transaction.atomic
+def add_comment(post: Post, user: User, content: str | None) -> PostComment:
+    """
+    Creates the comment and updates the comment counter of the post.
+    """
+
+    comment = PostComment.objects.create(post=post, author=user, content=content)
+    Post.objects.filter(id=post.id).update(comment_count=F("comment_count") + 1)
+    return comment
+
+
+@sync_to_async
+@transaction.atomic
+def remove_comment(comment: PostComment):
+    """
+    Deletes the comment and updates the comment counter of the post.
+    """
+
+    comment.delete()
+    Post.objects.filter(id=comment.post_id).update(comment_count=F("comment_count") - 1)
 
 
 @router.post("/comment/{id}", response={201: CommentOutMinimal, 404: str, 422: str})
-def comment_post(
+async def comment_post(
     request, id: UUID4, data: Form[PostIn], file: File[UploadedFile] = None
 ):
-    if not data.content and not file:
+    if not data.content and not file and not data.uploads:
         return 422, "Data not provided"
 
-    post = Post.objects.filter(id=id).first()
+    if len(data.uploads) + bool(file) > 1:
+        return 422, "Only one file is allowed"
+
+    post = await Post.objects.filter(id=id).afirst()
 
     if not post:
         return 404, "Post not found"
 
-    comment = PostComment.objects.create(
-        post=post, author=request.auth, content=data.content
+    uploads = await sync_to_async(open_uploads)(request.auth, data.uploads)
+    if uploads is None:
+        return 404, "Upload not found"
+
+    comment = await add_comment(post, request.auth, data.content)
+    await sync_to_async(save_file)(
+        comment.file, file or (uploads[0] if uploads else None), ["image", "video"]
     )
-    save_file(comment.file, file, ["image", "video"])
+    await sync_to_async(release_uploads)(uploads)
 
-    create_notification(
-        post.author.id,
+    await acreate_aggregated_notification(
+        post.author_id,
         Notification.Types.POST_COMMENTED,
         {
             "postId": str(post.id),
@@ -120,31 +218,31 @@ def comment_post(
 
 
 @router.delete("/comment/{id}", response={200: str, 404: str})
-def delete_comment(request, id: UUID4):
-    comment = PostComment.objects.filter(id=id, author=request.auth).first()
+async def delete_comment(request, id: UUID4):
+    comment = await PostComment.objects.filter(id=id, author=request.auth).afirst()
     if not comment:
         return 404, "Comment not found"
 
-    comment.delete()
+    await remove_comment(comment)
     return 200, "Comment deleted"
 
 
-@router.get("/{id}/comments", response={404: str, 200: List[CommentOut]})
-@paginate
-def get_comments(request, id: UUID4):
-    post = Post.objects.filter(id=id).first()
+@router.get("/{id}/comments", response=List[CommentOut])
+@paginate(CursorPagination, ordering_field="commented_at")
+async def get_comments(request, id: UUID4):
+    post = await Post.objects.filter(id=id).afirst()
     if not post:
-        return 404, "Post not found"
+        raise HttpError(404, "Post not found")
 
     return PostComment.objects.filter(post=post).order_by("-commented_at").select_related("author")
 
 
-@router.get("/ofUser/{id}", response={404: str, 200: List[PostOut]})
-@paginate
-def get_user_posts(request, id: UUID4):
-    user = User.objects.filter(id=id).first()
+@router.get("/ofUser/{id}", response=List[PostOut])
+@paginate(CursorPagination, ordering_field="posted_at")
+async def get_user_posts(request, id: UUID4):
+    user = await User.objects.filter(id=id).afirst()
     if not user:
-        return 404, "User not found"
+        raise HttpError(404, "User not found")
 
     return Post.include_extra(Post.objects.filter(author=user).order_by("-posted_at"), request.auth)
 
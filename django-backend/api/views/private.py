@@ -3,6 +3,7 @@ from typing import Any
 from django.http import HttpResponse
 from ninja import Router
 
+from api.auth import verify_private_file
 from api.models import Message
 
 
@@ -10,13 +11,30 @@ router = Router(tags=["private"])
 
 
 @router.get("/{file}", response={200: Any, 404: Any})
-def home(request, file: str):
-    if (
-        msg := Message.objects.filter(file=f"private/{file}").first()
-    ) is None or request.auth.id not in [msg.sender_id, msg.recipient_id]:
+def home(request, file: str, expires: int = None, signature: str = None):
+    """
+    Signed URLs are verified without the database, the unsigned ones of older clients
+    are checked against the message of the file.
+    """
+
+    if expires is None or signature is None:
+        authorized = is_participant(request.auth, file)
+    else:
+        authorized = verify_private_file(
+            f"private/{file}", request.auth.id, expires, signature
+        )
+
+    if not authorized:
         return 404
 
     res = HttpResponse(status=200)
     res["Content-Type"] = ""
     res["X-Accel-Redirect"] = f"/private/{file}"
     return res
+
+
+def is_participant(user, file: str) -> bool:
+    # The variants are named after the file (abc.small.webp), so their message is found by its stem
+    stem = file.split(".")[0]
+    msg = stem and Message.objects.filter(file__startswith=f"private/{stem}.").first()
+    return bool(msg) and user.id in [msg.sender_id, msg.recipient_id]
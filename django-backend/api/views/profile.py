@@ -0,0 +1,25 @@
+from ninja import Router
+
+from api.profiling import has_profile_access, operation_ids, recent_profiles, summarize
+from api.schemas import ProfileSummaryOut
+
+
+router = Router(tags=["profile"])
+
+
+@router.get("/summary", response={200: ProfileSummaryOut, 403: str, 404: str})
+def summary(request, operation: str = None, samples: int = 50, limit: int = 30):
+    """
+    The top functions by cumulative time across the latest profiles, of one operation
+    (e.g. api_views_post_get_feed) or of all of them. It needs the `X-Profile` secret header.
+    """
+
+    if not has_profile_access(request):
+        return 403, "Profiling access denied"
+
+    # The operation names a directory, so only the known ones are accepted
+    if operation is not None and operation not in operation_ids:
+        return 404, "Operation not found"
+
+    paths = recent_profiles(operation)[:samples]
+    return {"samples": len(paths), "functions": summarize(paths, limit)}
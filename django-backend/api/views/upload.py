@@ -0,0 +1,109 @@
+import os
+
+from django.conf import settings
+from django.db import transaction
+from ninja import Router
+from pydantic import UUID4
+
+from api.models import Upload
+from api.schemas import UploadIn, UploadOut
+from api.uploads import SNIFF_SIZE, sniff_content_type, delete_upload
+
+
+router = Router(tags=["upload"])
+
+CHUNK_READ_SIZE = 64 * 1024
+
+
+@router.post("", response={201: UploadOut, 413: str, 415: str})
+def init_upload(request, data: UploadIn):
+    """
+    Starts a chunked upload, the chunks are then sent in order with `PUT /upload/{id}`.
+    The completed upload can be sent to the post, comment and message endpoints by its id.
+    """
+
+    if data.size > settings.UPLOAD_MAX_SIZE:
+        return 413, "File too large"
+
+    if not data.content_type.startswith(("image/", "video/")):
+        return 415, "Unsupported file type"
+
+    upload = Upload.objects.create(
+        user=request.auth, content_type=data.content_type, size=data.size
+    )
+    os.makedirs(settings.UPLOAD_ROOT, exist_ok=True)
+    open(upload.path, "wb").close()
+    return 201, upload
+
+
+@router.get("/{id}", response={200: UploadOut, 404: str})
+def get_upload(request, id: UUID4):
+    """
+    A dropped upload is resumed by sending the rest of the file from `received`.
+    """
+
+    upload = Upload.objects.filter(id=id, user=request.auth).first()
+    return (200, upload) if upload else (404, "Upload not found")
+
+
+@router.put(
+    "/{id}", response={200: UploadOut, 404: str, 409: UploadOut, 413: str, 415: str}
+)
+def append_upload(request, id: UUID4, offset: int):
+    """
+    The raw request body is appended to the upload, `offset` must be the bytes received so far.
+    The chunk is streamed to the disk, the size and the type are checked while it's written.
+    """
+
+    with transaction.atomic():
+        upload = (
+            Upload.objects.select_for_update()
+            .filter(id=id, user=request.auth, completed=False)
+            .first()
+        )
+        if not upload:
+            return 404, "Upload not found"
+
+        if offset != upload.received:
+            return 409, upload
+
+        with open(upload.path, "r+b") as file:
+            file.seek(offset)
+            while chunk := request.read(CHUNK_READ_SIZE):
+                if file.tell() + len(chunk) > upload.size:
+                    return 413, "The chunk exceeds the size of the upload"
+                file.write(chunk)
+
+            # Bytes of an interrupted chunk after this one are dropped
+            file.truncate()
+            upload.received = file.tell()
+
+        if offset < SNIFF_SIZE <= upload.received or upload.received == upload.size:
+            with open(upload.path, "rb") as file:
+                content_type = sniff_content_type(file.read(SNIFF_SIZE))
+
+            if (
+                not content_type
+                or content_type.split("/")[0] != upload.content_type.split("/")[0]
+            ):
+                delete_upload(upload)
+                return 415, "Unsupported file type"
+
+            upload.content_type = content_type
+
+        upload.save(update_fields=["received", "content_type"])
+    return 200, upload
+
+
+@router.post("/{id}/complete", response={200: UploadOut, 404: str, 409: UploadOut})
+def complete_upload(request, id: UUID4):
+    upload = Upload.objects.filter(id=id, user=request.auth).first()
+    if not upload:
+        return 404, "Upload not found"
+
+    if upload.received != upload.size:
+        return 409, upload
+
+    upload.completed = True
+    upload.save(update_fields=["completed"])
+    return 200, upload
@@ -1,6 +1,9 @@
 from typing import List
 
 from django.contrib.auth.hashers import make_password, check_password
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
 from pydantic import UUID4
 from ninja import Router, Form, File, UploadedFile, Path
 from ninja.pagination import paginate
@@ -12,12 +15,12 @@ from api.schemas import (
     UserLoginOut,
     UserUpdateIn,
     UserOutSingle,
-    UserOutMulti,
     UserSearchIn,
 )
 from api.helpers import save_file
-from api.models import User
-from api.auth import create_token
+from api.loaders import load_users
+from api.models import User, Friendship
+from api.auth import create_token, principals
 
 
 router = Router(tags=["user"])
@@ -72,10 +75,10 @@ def update(
         if value is not None:
             setattr(request.auth, key, value)
 
+    request.auth.save()
     save_file(request.auth.profile_image, profileImage, ["image"])
     save_file(request.auth.background_image, backgroundImage, ["image"])
-
-    request.auth.save()
+    principals.invalidate(str(request.auth.id))
     return 200, "User updated"
 
 
@@ -84,10 +87,40 @@ def me(request):
     return {"id": request.auth.id}
 
 
-@router.get("/search/{query}", response=List[UserOutMulti])
+@router.get("/search/{query}", response=List[UserOutSingle])
+@load_users
 @paginate
 def search(request, filters: UserSearchIn = Path(...)):
-    return filters.filter(User.objects.all())
+    """
+    Users are ranked by how similar their name is to the query,
+    friends come first and friends of friends next.
+    """
+
+    friend_ids = request.auth.friends()
+    friendships = Friendship.objects.filter(accepted_at__isnull=False)
+    friends_of_friends = (
+        Q(id__in=friendships.filter(requested_by__in=friend_ids).values("accepted_by"))
+        | Q(
+            id__in=friendships.filter(accepted_by__in=friend_ids).values("requested_by")
+        )
+    ) & ~Q(id=request.auth.id)
+
+    return (
+        filters.filter(User.objects.all())
+        .annotate(
+            closeness=Case(
+                When(id__in=friend_ids, then=Value(2)),
+                When(friends_of_friends, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            similarity=Greatest(
+                TrigramWordSimilarity(filters.query, "first_name"),
+                TrigramWordSimilarity(filters.query, "last_name"),
+            ),
+        )
+        .order_by("-closeness", "-similarity", "id")
+    )
 
 
 @router.get("/{id}", response={200: UserOutSingle, 404: str})
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     "django.contrib.contenttypes",
     "django.contrib.auth",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "corsheaders",
     "api",
     "ninja",
@@ -27,6 +28,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middlewares.collect_metrics",
     "django.middleware.security.SecurityMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,6 +81,17 @@ CHANNEL_LAYERS = {
     }
 }
 
+# The cache lives in the database so it's shared between the uvicorn workers, it's only
+# for the few keys the workers must agree on, the hot data is cached per worker instead.
+# Run `python manage.py createcachetable` before starting the server.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "api_cache",
+        "OPTIONS": {"MAX_ENTRIES": 100_000},
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -105,3 +118,68 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 NINJA_PAGINATION_CLASS = "ninja.pagination.PageNumberPagination"
 NINJA_PAGINATION_PER_PAGE = 10
+
+# Posts are pushed to the timelines of the author's friends unless the author has more
+# friends than the limit, then they are pulled when the feed is read.
+FEED_FANOUT_LIMIT = 5000
+# How many posts of a new friend are pushed to the user's timeline.
+FEED_BACKFILL_SIZE = 100
+# Timelines keep the latest posts, about one in FEED_TIMELINE_TRIM_EVERY recipients
+# of a fan-out gets their timeline trimmed, so it's a few posts longer at most.
+FEED_TIMELINE_SIZE = 1000
+FEED_TIMELINE_TRIM_EVERY = 50
+
+# The authenticated users are cached per worker for this many seconds
+AUTH_PRINCIPAL_CACHE_SIZE = 10_000
+AUTH_PRINCIPAL_CACHE_TTL = 60
+# And so are the friend ids of the users
+FRIENDS_CACHE_SIZE = 10_000
+FRIENDS_CACHE_TTL = 60
+
+# The uploads get a WebP and a JPEG variant for every width that is smaller than them,
+# they are generated by a pool of worker processes (0 generates them inside the request).
+MEDIA_VARIANT_WIDTHS = {"thumbnail": 160, "small": 480, "large": 1280}
+MEDIA_PROCESS_WORKERS = int(CONFIG.get("MEDIA_PROCESS_WORKERS", 2))
+
+# Large files are uploaded in chunks to this directory, it's on the same volume
+# as the private files, so unfinished uploads survive restarts.
+UPLOAD_ROOT = BASE_DIR / "private" / "uploads"
+UPLOAD_MAX_SIZE = 500 * 1024 * 1024
+# The unfinished uploads are deleted by the clear_uploads command after this many hours
+UPLOAD_EXPIRY_HOURS = 24
+
+# The URLs of the private files are signed for the viewer and expire after this many seconds
+PRIVATE_FILE_URL_TTL = 60 * 60
+
+# Likes and comments on a post are aggregated into one unread notification for this many seconds,
+# and its pushes are sent at most once per debounce interval.
+NOTIFICATION_AGGREGATION_WINDOW = 24 * 60 * 60
+NOTIFICATION_PUSH_DEBOUNCE = 10
+
+# The notification partitions older than this many months are detached by
+# `manage.py maintain_partitions` (None keeps them), and kept as archive tables or dropped.
+NOTIFICATION_RETENTION_MONTHS = 12
+NOTIFICATION_RETENTION_ARCHIVE = True
+
+# Every worker writes its request histograms to this directory, /metrics adds them up.
+# It's served on the backend port only, nginx doesn't proxy it.
+METRICS_DIR = BASE_DIR / "metrics"
+METRICS_FLUSH_INTERVAL = 5
+
+# Requests are profiled with cProfile when they send the X-Profile header with the secret,
+# or at random with the sample rate. Every operation keeps its newest PROFILE_KEEP profiles.
+PROFILE_SECRET = CONFIG.get("PROFILE_SECRET")
+PROFILE_SAMPLE_RATE = float(CONFIG.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = BASE_DIR / "profiles"
+PROFILE_KEEP = 500
+
+# The statements slower than SLOW_QUERY_THRESHOLD seconds are appended to SLOW_QUERY_LOG,
+# an empty threshold disables it. SLOW_QUERY_EXPLAIN runs the slow SELECTs again with
+# EXPLAIN (ANALYZE, BUFFERS) to log their plans, so it's meant for debug and staging.
+# SLOW_QUERY_PARAMS logs the parameters of the statements, which are user data, so it's
+# only on for debug and staging too, the plans can show them as well.
+SLOW_QUERY_THRESHOLD = CONFIG.get("SLOW_QUERY_THRESHOLD", "0.2")
+SLOW_QUERY_THRESHOLD = float(SLOW_QUERY_THRESHOLD) if SLOW_QUERY_THRESHOLD else None
+SLOW_QUERY_EXPLAIN = DEBUG or CONFIG.get("SLOW_QUERY_EXPLAIN") == "1"
+SLOW_QUERY_PARAMS = DEBUG or CONFIG.get("SLOW_QUERY_PARAMS") == "1"
+SLOW_QUERY_LOG = BASE_DIR / "logs" / "slow_queries.jsonl"
@@ -15,6 +15,8 @@ from django.urls import path
 from ninja import NinjaAPI, Swagger, Router
 
 from api.helpers import camel_case_responses
+from api.metrics import instrument_operations
+from api.profiling import profile_operations
 from api.auth import AuthBearer
 from api.views.user import router as user_router
 from api.views.private import router as private_router
@@ -22,6 +24,9 @@ from api.views.notification import router as notification_router
 from api.views.friendship import router as friendship_router
 from api.views.message import router as message_router
 from api.views.post import router as post_router
+from api.views.upload import router as upload_router
+from api.views.profile import router as profile_router
+from api.views.metrics import metrics
 
 
 api = NinjaAPI(
@@ -38,12 +43,16 @@ api_router.add_router("notification", notification_router)
 api_router.add_router("friendship", friendship_router)
 api_router.add_router("message", message_router)
 api_router.add_router("post", post_router)
+api_router.add_router("upload", upload_router)
+api_router.add_router("profile", profile_router)
 
 
 if not settings.DEBUG:
     api_router.add_router("/private", private_router)
 
 camel_case_responses(api)
+instrument_operations(api)
+profile_operations(api)
 
 dev_files = (
     (
@@ -56,4 +65,5 @@ dev_files = (
 
 urlpatterns = [
     path("", api.urls),
+    path("metrics", metrics),
 ] + dev_files
@@ -94,6 +94,10 @@ function PostInteraction({ notification }) {
             </div>
             <div>
                 <b>{`${notification.data.firstName} ${notification.data.lastName} `}</b>
+                {notification.data.actorCount > 1 &&
+                    `and ${notification.data.actorCount - 1} other${
+                        notification.data.actorCount > 2 ? "s" : ""
+                    } `}
                 {notification.type === "POST_LIKED"
                     ? "liked your post!"
                     : notification.type === "POST_COMMENTED"
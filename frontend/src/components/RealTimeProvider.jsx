@@ -68,11 +68,12 @@ export default function RealTimeProvider({ children }) {
     }, [user]);
 
     // Listen for new notifications and update unread notification count
+    // The python backend pushes the count with the event, the node one doesn't
     useEffect(() => {
-        const onNewNotificationHandler = () => {
+        const onNewNotificationHandler = (data) => {
             alertAudio.current.currentTime = 0;
             alertAudio.current.play();
-            setUnreadNotificationCount((c) => c + 1);
+            setUnreadNotificationCount((c) => data?.unreadCount ?? c + 1);
         };
         onNewNotification(onNewNotificationHandler);
         return () => offNewNotification(onNewNotificationHandler);
@@ -80,10 +81,10 @@ export default function RealTimeProvider({ children }) {
 
     // Listen for new messages and update unread message count
     useEffect(() => {
-        const onNewMessageHandler = () => {
+        const onNewMessageHandler = (data) => {
             alertAudio.current.currentTime = 0;
             alertAudio.current.play();
-            setUnreadMessageCount((c) => c + 1);
+            setUnreadMessageCount((c) => data?.unreadCount ?? c + 1);
         };
         onNewMessage(onNewMessageHandler);
         return () => offNewMessage(onNewMessageHandler);